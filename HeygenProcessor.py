@@ -10,6 +10,8 @@ from typing import Iterable, Optional
 import httpx
 from dotenv import load_dotenv
 
+import resilience
+
 load_dotenv()
 
 API_HEYGEN = os.environ["API_HEYGEN"]
@@ -24,11 +26,54 @@ class HeygenError(RuntimeError):
     pass
 
 
+UPLOAD = resilience.endpoint("heygen.upload")
+GENERATE = resilience.endpoint("heygen.video_generate")
+STATUS = resilience.endpoint("heygen.video_status")
+
+
+def _server_error(r: httpx.Response) -> bool:
+    return r.status_code >= 500 or r.status_code == 429
+
+
+_client: Optional[httpx.Client] = None
+
+
+def get_client() -> httpx.Client:
+    """Shared keep-alive client, so jobs reuse connections opened at startup."""
+    global _client
+    if _client is None:
+        _client = httpx.Client(
+            timeout=TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=300),
+        )
+    return _client
+
+
 class HeygenProcessor:
 
     def __init__(self):
         pass
 
+    def check_api_key(self, client: httpx.Client) -> dict:
+        r = client.get(
+            f"{API_URL}/v2/user/remaining_quota", headers=HEADERS, timeout=TIMEOUT
+        )
+        if r.status_code in (401, 403):
+            raise HeygenError(f"API key rejected: HTTP {r.status_code}")
+        r.raise_for_status()
+        return (r.json() or {}).get("data") or {}
+
+    def list_voices(self, client: httpx.Client) -> list[dict]:
+        r = client.get(f"{API_URL}/v2/voices", headers=HEADERS, timeout=TIMEOUT)
+        r.raise_for_status()
+        j = r.json() or {}
+        return (j.get("data") or {}).get("voices") or j.get("voices") or []
+
+    def warm_up(self, client: httpx.Client) -> None:
+        # any response is fine: we only need DNS + TLS done and the connection pooled
+        for base in (API_URL, UPLOAD_ULR):
+            client.head(base, timeout=TIMEOUT)
+
     def guess_mime(self, path: Path) -> str:
         mime, _ = mimetypes.guess_type(str(path))
         if mime not in ("image/jpeg", "image/png"):
@@ -41,12 +86,19 @@ class HeygenProcessor:
     ) -> str:
         with open(image_path, "rb") as f:
             data = f.read()
-        r = client.post(
-            f"{UPLOAD_ULR}/v1/talking_photo",
-            headers={**HEADERS, "Content-Type": mime},
-            content=data,
-            timeout=TIMEOUT,
-        )
+        try:
+            r = resilience.guarded_sync(
+                UPLOAD,
+                lambda: client.post(
+                    f"{UPLOAD_ULR}/v1/talking_photo",
+                    headers={**HEADERS, "Content-Type": mime},
+                    content=data,
+                    timeout=TIMEOUT,
+                ),
+                is_failure=_server_error,
+            )
+        except resilience.CircuitOpenError as e:
+            raise HeygenError(f"Upload unavailable: {e}") from e
         if r.status_code >= 400:
             # try to display server message
             msg = r.text
@@ -105,12 +157,19 @@ class HeygenProcessor:
                 }
             ],
         }
-        r = client.post(
-            f"{API_URL}/v2/video/generate",
-            headers=HEADERS,
-            json=payload,
-            timeout=TIMEOUT,
-        )
+        try:
+            r = resilience.guarded_sync(
+                GENERATE,
+                lambda: client.post(
+                    f"{API_URL}/v2/video/generate",
+                    headers=HEADERS,
+                    json=payload,
+                    timeout=TIMEOUT,
+                ),
+                is_failure=_server_error,
+            )
+        except resilience.CircuitOpenError as e:
+            raise HeygenError(f"video.generate unavailable: {e}") from e
         if r.status_code >= 400:
             raise HeygenError(f"video.generate failed: HTTP {r.status_code}: {r.text}")
         j = r.json() or {}
@@ -122,12 +181,20 @@ class HeygenProcessor:
 
     def get_video_url(self, client: httpx.Client, video_id: str) -> Optional[str]:
         # print('внутри ЗАПРОСА К ВИДЕО, video_id=', video_id)
-        r = client.get(
-            f"{API_URL}/v1/video_status.get",
-            params={"video_id": video_id},
-            headers=HEADERS,
-            timeout=TIMEOUT,
-        )
+        # статус идемпотентен: зависший запрос хеджируется вторым после p95
+        try:
+            r = resilience.hedged_sync(
+                STATUS,
+                lambda: client.get(
+                    f"{API_URL}/v1/video_status.get",
+                    params={"video_id": video_id},
+                    headers=HEADERS,
+                    timeout=TIMEOUT,
+                ),
+                is_failure=_server_error,
+            )
+        except resilience.CircuitOpenError as e:
+            raise HeygenError(f"video_status unavailable: {e}") from e
         r.raise_for_status()
         j = r.json() or {}
         print(j)
@@ -139,25 +206,31 @@ class HeygenProcessor:
             raise HeygenError(f"Render failed: {j}")
         return None
 
-    def wait_and_download(
+    def wait_video_url(
         self,
         client: httpx.Client,
         video_id: str,
-        out_path: Path,
         delays: Iterable[float] = (3, 5, 8, 8, 8, 13, 21, 34, 55),
-    ) -> None:
-        url: Optional[str] = None
+    ) -> str:
         for d in delays:
             time.sleep(d)
             url = self.get_video_url(client, video_id)
             if url:
-                break
-        if not url:
-            raise HeygenError("Timeout: video is not ready")
+                return url
+        raise HeygenError("Timeout: video is not ready")
 
-        # download
+    def download(self, client: httpx.Client, url: str, out_path: Path) -> None:
         with client.stream("GET", url, timeout=TIMEOUT) as r:
             r.raise_for_status()
             with open(out_path, "wb") as f:
                 for chunk in r.iter_bytes():
                     f.write(chunk)
+
+    def wait_and_download(
+        self,
+        client: httpx.Client,
+        video_id: str,
+        out_path: Path,
+        delays: Iterable[float] = (3, 5, 8, 8, 8, 13, 21, 34, 55),
+    ) -> None:
+        self.download(client, self.wait_video_url(client, video_id, delays), out_path)
@@ -1,5 +1,7 @@
 import os
-import subprocess
+from pathlib import Path
+
+import transcode
 
 
 class VideoProcessor:
@@ -10,27 +12,17 @@ class VideoProcessor:
         """
         Обрабатывает видео в круглый формат (1:1 с прозрачным фоном).
 
+        Кодирование выполняет бэкенд из transcode.get_backend()
+        (ffmpeg-процесс или PyAV в пуле), пресет подстраивается под нагрузку.
+
         :param file_path: Путь к исходному видео
         :param output_path: Путь для сохранения результата
         :return: Путь к обработанному видео
         """
-        # Создаём маску в виде круга
-        ffmpeg_cmd = [
-            "ffmpeg",
-            "-i",
-            file_path,
-        '-vf', f"scale=w=512:h=512:force_original_aspect_ratio=decrease,"
-               f"pad=w=512:h=512:x=(ow-iw)/2:y=(oh-ih)/2:color={bg_color}",
-        '-c:v', 'libx264',
-        '-preset', 'fast',
-        '-crf', '23',
-        '-movflags', '+faststart',
-        '-y',  # Перезаписать если существует
-            output_path,
-        ]
-
         try:
-            subprocess.run(ffmpeg_cmd, check=True)
+            await transcode.run(
+                Path(file_path), Path(output_path), transcode.circle_spec(bg_color)
+            )
             return output_path
-        except subprocess.CalledProcessError as e:
+        except transcode.TranscodeError as e:
             raise Exception(f"FFmpeg error: {e}")
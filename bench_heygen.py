@@ -0,0 +1,46 @@
+"""Пропускная способность пакетного image-to-video (heygen_api) на фейковом HeyGen.
+
+    python bench_heygen.py -n 50 -c 8 --latency 0.2 --render 2
+
+Сравнивает последовательную отправку с ``HeyGenHandler.create_videos``.
+"""
+import argparse
+import asyncio
+import time
+
+import heygen_api
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--requests", type=int, default=20)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.1, help="задержка ответа API, с")
+    parser.add_argument("--render", type=float, default=1.0, help="время рендера, с")
+    args = parser.parse_args()
+
+    requests = [
+        heygen_api.ImageToVideoRequest(image_url=f"https://example.com/{i}.jpg", text="hello")
+        for i in range(args.requests)
+    ]
+    delays = (args.render / 4,) * 8
+
+    fake = heygen_api.FakeHeyGen(latency=args.latency, render_time=args.render)
+    async with heygen_api.HeyGenHandler("fake", transport=fake.transport) as api:
+        started = time.perf_counter()
+        for r in requests:
+            video = await api.create_video_from_image_and_text(r.image_url, r.text, r.voice_id)
+            await api.wait_for_video(video, delays)
+        sequential = time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await api.create_videos(requests, concurrency=args.concurrency, delays=delays)
+        batched = time.perf_counter() - started
+
+    ok = sum(isinstance(r, heygen_api.VideoResult) for r in results)
+    print(f"sequential: {sequential:.1f}s ({args.requests / sequential:.2f} videos/s)")
+    print(f"   batched: {batched:.1f}s ({args.requests / batched:.2f} videos/s), ok={ok}/{args.requests}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""Сравнение бэкендов транскодирования на одном и том же клипе.
+
+    python bench_transcode.py result.mp4 -n 20 -c 4 --spec square
+
+Сначала сверяет выход бэкендов через ffprobe (размер кадра, fps, pix_fmt,
+профиль/уровень H.264, аудиокодек и битрейт) и завершается с ошибкой, если
+они расходятся: сравнивать скорость имеет смысл только при одинаковом
+результате. Затем для каждого доступного бэкенда гоняет ``-n`` задач с
+параллелизмом ``-c`` и печатает латентность одной задачи (mean/p50/p95) и
+пропускную способность.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import transcode
+
+SPECS = {"circle": transcode.circle_spec(), "square": transcode.SQUARE_640}
+
+VIDEO_FIELDS = ("codec_name", "width", "height", "r_frame_rate", "pix_fmt", "profile", "level")
+AUDIO_FIELDS = ("codec_name", "sample_rate", "channels")
+AUDIO_BITRATE_TOLERANCE = 0.1  # AAC-энкодер не держит битрейт точно
+
+
+async def probe(path: Path) -> dict:
+    """Параметры потоков файла по ffprobe: ``{"video": {...}, "audio": {...}}``."""
+    proc = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-show_streams", "-of", "json", str(path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {err.decode('utf-8', 'ignore')}")
+    streams = {}
+    for stream in json.loads(out).get("streams", []):
+        kind = stream.get("codec_type")
+        fields = VIDEO_FIELDS if kind == "video" else AUDIO_FIELDS + ("bit_rate",)
+        if kind in ("video", "audio") and kind not in streams:
+            streams[kind] = {f: stream.get(f) for f in fields}
+    return streams
+
+
+def compare(reference: dict, other: dict) -> list[str]:
+    """Расхождения параметров потоков ``other`` относительно ``reference``."""
+    diffs = []
+    for kind in sorted(set(reference) | set(other)):
+        ref, got = reference.get(kind), other.get(kind)
+        if ref is None or got is None:
+            diffs.append(f"{kind}: stream {'missing' if got is None else 'unexpected'}")
+            continue
+        for field in ref:
+            if field == "bit_rate":
+                a, b = int(ref[field] or 0), int(got[field] or 0)
+                if abs(a - b) > AUDIO_BITRATE_TOLERANCE * max(a, b):
+                    diffs.append(f"{kind}.{field}: {a} != {b}")
+            elif ref[field] != got[field]:
+                diffs.append(f"{kind}.{field}: {ref[field]} != {got[field]}")
+    return diffs
+
+
+async def check_parity(backends: list, src: Path, spec: transcode.TranscodeSpec) -> bool:
+    """Транскодирует клип каждым бэкендом и сверяет результат с первым."""
+    with tempfile.TemporaryDirectory() as td:
+        probes = []
+        for backend in backends:
+            dst = Path(td) / f"{backend.name}.mp4"
+            await backend.transcode(src, dst, spec)
+            probes.append((backend.name, await probe(dst)))
+    ref_name, reference = probes[0]
+    print(f"{ref_name:>10}: {reference}")
+    ok = True
+    for name, streams in probes[1:]:
+        diffs = compare(reference, streams)
+        print(f"{name:>10}: " + ("matches" if not diffs else "; ".join(diffs)))
+        ok = ok and not diffs
+    return ok
+
+
+async def bench(backend, src: Path, spec: transcode.TranscodeSpec, runs: int, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    with tempfile.TemporaryDirectory() as td:
+        async def one(i: int) -> None:
+            async with sem:
+                started = time.perf_counter()
+                await backend.transcode(src, Path(td) / f"out_{i}.mp4", spec)
+                latencies.append(time.perf_counter() - started)
+
+        await one(-1)  # прогрев: кодеки, пул воркеров
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(runs)))
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "mean": statistics.mean(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+        "jobs_per_s": runs / wall,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", type=Path)
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    parser.add_argument("-c", "--concurrency", type=int, default=2)
+    parser.add_argument("--spec", choices=SPECS, default="square")
+    parser.add_argument("--pool", choices=("thread", "process"), default="thread")
+    args = parser.parse_args()
+
+    backends = [transcode.SubprocessBackend()]
+    try:
+        backends.append(transcode.PyAVBackend(pool=args.pool))
+    except ImportError:
+        print("pyav: PyAV не установлен (pip install av), пропускаю")
+
+    if len(backends) > 1 and not await check_parity(backends, args.input, SPECS[args.spec]):
+        raise SystemExit("бэкенды дают разный результат, бенчмарк не имеет смысла")
+
+    for backend in backends:
+        r = await bench(backend, args.input, SPECS[args.spec], args.runs, args.concurrency)
+        print(
+            f"{backend.name:>10}: mean={r['mean'] * 1000:.0f}ms p50={r['p50'] * 1000:.0f}ms "
+            f"p95={r['p95'] * 1000:.0f}ms throughput={r['jobs_per_s']:.2f} jobs/s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,23 @@
-import asyncio, os, tempfile, uuid, json, math, shutil, sys
+from __future__ import annotations
+
+import startup
+import resilience
+import transcode
+import load_policy
+import progress
+import workspace
+import jobtrace
+import loopmon
+
+import asyncio, os, uuid, json, math, logging, itertools
 from pathlib import Path
 from dataclasses import dataclass
 from typing import Optional
 
-import httpx
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart
-from aiogram.types import Message
+from aiogram.filters import Command, CommandStart
+from aiogram.filters import CommandObject
+from aiogram.types import BufferedInputFile, Message, FSInputFile, InputMediaVideo
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,11 +28,38 @@ DEFAULT_VOICE_ID = os.environ.get("HEYGEN_VOICE_ID") or ""
 
 API_BASE = "https://api.heygen.com"
 UPLOAD_BASE = "https://upload.heygen.com"
-TIMEOUT = httpx.Timeout(30.0, read=60.0)
 HEADERS = {"X-Api-Key": HEYGEN_KEY}
+# кому доступны служебные команды (/health, /profile)
+ADMIN_IDS = {int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x.strip()}
+
+# httpx импортируется при первом обращении (на старте, а не при импорте модуля)
+httpx = startup.lazy_module("httpx")
+
+logger = logging.getLogger(__name__)
 
 bot = Bot(BOT_TOKEN)
+bot.session.middleware(progress.BudgetMiddleware())
 dp = Dispatcher()
+STARTUP = startup.Startup()
+
+_client: Optional[httpx.AsyncClient] = None
+UPLOAD = resilience.endpoint("heygen.upload")
+GENERATE = resilience.endpoint("heygen.video_generate")
+STATUS = resilience.endpoint("heygen.video_status")
+
+# голос выбирается один раз на старте, а не в каждой задаче
+RU_VOICE_ID: Optional[str] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Общий пул соединений к HeyGen и Telegram file API."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, read=60.0),
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=300),
+        )
+    return _client
 
 # --- простое состояние на словаре (без БД) ---
 USER_CTX: dict[int, dict] = {}
@@ -32,27 +70,13 @@ class HeygenResult:
     video_url: Optional[str] = None
 
 
+def _server_error(r: httpx.Response) -> bool:
+    return r.status_code >= 500 or r.status_code == 429
+
+
 async def ffmpeg_square_640(input_path: Path, output_path: Path) -> None:
     """Простой рескейл 720→640, 25 fps, H.264 Baseline + AAC"""
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", "scale=640:640",
-        "-r", "25",
-        "-c:v", "libx264",
-        "-profile:v", "baseline", "-level", "3.0",
-        "-pix_fmt", "yuv420p",
-        "-crf", "20", "-preset", "veryfast",
-        "-c:a", "aac", "-b:a", "128k",
-        "-movflags", "+faststart",
-        str(output_path),
-    ]
-    proc = await asyncio.create_subprocess_exec(*cmd,
-                                                stdout=asyncio.subprocess.PIPE,
-                                                stderr=asyncio.subprocess.PIPE)
-    _, err = await proc.communicate()
-    if proc.returncode != 0:
-        raise RuntimeError(f"ffmpeg failed: {err.decode('utf-8', 'ignore')}")
+    await transcode.run(input_path, output_path, transcode.SQUARE_640)
 
 
 async def pick_ru_voice(client: httpx.AsyncClient) -> Optional[str]:
@@ -60,9 +84,16 @@ async def pick_ru_voice(client: httpx.AsyncClient) -> Optional[str]:
     /v2/voices/locales → { data: { locales: [...] } }
     /v2/voices          → { voices: [...] }
     """
+    global RU_VOICE_ID
     if DEFAULT_VOICE_ID:
         return DEFAULT_VOICE_ID
+    if RU_VOICE_ID:
+        return RU_VOICE_ID
+    RU_VOICE_ID = await _find_ru_voice(client)
+    return RU_VOICE_ID
+
 
+async def _find_ru_voice(client: httpx.AsyncClient) -> Optional[str]:
     # 1) Получаем локали и собираем ru-набор
     resp = await client.get(f"{API_BASE}/v2/voices/locales", headers=HEADERS)
     resp.raise_for_status()
@@ -101,9 +132,13 @@ async def pick_ru_voice(client: httpx.AsyncClient) -> Optional[str]:
 
 
 async def upload_talking_photo(client: httpx.AsyncClient, content: bytes, mime: str) -> str:
-    r = await client.post(f"{UPLOAD_BASE}/v1/talking_photo",
-                          headers={**HEADERS, "Content-Type": mime},
-                          content=content)
+    r = await resilience.guarded(
+        UPLOAD,
+        lambda: client.post(f"{UPLOAD_BASE}/v1/talking_photo",
+                            headers={**HEADERS, "Content-Type": mime},
+                            content=content),
+        is_failure=_server_error,
+    )
     r.raise_for_status()
     data = r.json()
     tp_id = data.get("talking_photo_id") or data.get("id") or ""
@@ -112,7 +147,9 @@ async def upload_talking_photo(client: httpx.AsyncClient, content: bytes, mime:
     return tp_id  # /v1 endpoint, быстрый путь. ([docs.heygen.com](https://docs.heygen.com/discuss/676308cbe4fd890041128d27?utm_source=chatgpt.com))
 
 
-async def create_video(client: httpx.AsyncClient, talking_photo_id: str, text: str, voice_id: str) -> HeygenResult:
+async def create_video(client: httpx.AsyncClient, talking_photo_id: str, text: str, voice_id: str,
+                       emotion: str = "Excited", talking_style: str = "expressive",
+                       expression: str = "happy") -> HeygenResult:
     payload = {
         "dimension": {"width": 720, "height": 720},
         "title": f"tg-{uuid.uuid4()}",
@@ -121,8 +158,8 @@ async def create_video(client: httpx.AsyncClient, talking_photo_id: str, text: s
             "character": {
                 "type": "talking_photo",
                 "talking_photo_id": talking_photo_id,
-                "talking_style": "expressive",
-                "expression": "happy",
+                "talking_style": talking_style,
+                "expression": expression,
                 "talking_photo_style": "square",
                 "scale": 1.1,
                 "offset": {"x": 0.0, "y": 0.0},
@@ -133,12 +170,16 @@ async def create_video(client: httpx.AsyncClient, talking_photo_id: str, text: s
                 "input_text": text[:2000],  # некоторые инстансы валидируют на 2000 симв. ([docs.heygen.com](https://docs.heygen.com/discuss/674292a5124fe50018a3b207?utm_source=chatgpt.com))
                 "speed": 1.3,
                 "locale": "ru-RU",
-                "emotion": "Excited"
+                "emotion": emotion
             },
             "background": {"type": "color", "value": "#0E0E12"}
         }]
     }
-    r = await client.post(f"{API_BASE}/v2/video/generate", headers=HEADERS, json=payload, timeout=TIMEOUT)
+    r = await resilience.guarded(
+        GENERATE,
+        lambda: client.post(f"{API_BASE}/v2/video/generate", headers=HEADERS, json=payload),
+        is_failure=_server_error,
+    )
     if r.status_code >= 400:
         # пробрасываем текст ошибки пользователю
         raise RuntimeError(f"HeyGen error {r.status_code}: {r.text}")
@@ -151,7 +192,12 @@ async def create_video(client: httpx.AsyncClient, talking_photo_id: str, text: s
 
 async def get_video_url(client: httpx.AsyncClient, video_id: str) -> Optional[str]:
     # URL истекает через 7 дней; при повторном запросе выдаётся новый. ([docs.heygen.com](https://docs.heygen.com/reference/video-status?utm_source=chatgpt.com), [docs.heygen.com](https://docs.heygen.com/discuss/67361ac3ca7398002a62316c?utm_source=chatgpt.com))
-    r = await client.get(f"{API_BASE}/v1/video_status.get", params={"video_id": video_id}, headers=HEADERS)
+    # статус идемпотентен: зависший запрос хеджируется вторым после p95
+    r = await resilience.hedged(
+        STATUS,
+        lambda: client.get(f"{API_BASE}/v1/video_status.get", params={"video_id": video_id}, headers=HEADERS),
+        is_failure=_server_error,
+    )
     r.raise_for_status()
     data = r.json()
     status = (data.get("status") or "").lower()
@@ -162,6 +208,187 @@ async def get_video_url(client: httpx.AsyncClient, video_id: str) -> Optional[st
     return None
 
 
+POLL_DELAYS = (3, 5, 8, 13, 21, 34)
+
+
+async def wait_video_url(client: httpx.AsyncClient, video_id: str) -> str:
+    """Поллинг с backoff; можно заменить на вебхуки."""
+    for delay in POLL_DELAYS:
+        await asyncio.sleep(delay)
+        url = await get_video_url(client, video_id)
+        if url:
+            return url
+    raise TimeoutError("Слишком долго генерируется")
+
+
+async def download_video(client: httpx.AsyncClient, url: str, path: Path) -> None:
+    async with client.stream("GET", url) as r:
+        r.raise_for_status()
+        with open(path, "wb") as f:
+            async for chunk in r.aiter_bytes():
+                f.write(chunk)
+
+
+# --- fan-out: одна загрузка фото, несколько вариантов рендера параллельно ---
+FANOUT_FIELDS = ("voice_id", "emotion", "talking_style", "expression")
+MAX_VARIANTS = 10  # лимит media group в Telegram
+
+
+def parse_variants(args: str) -> list[dict]:
+    """``emotion=Excited,Serious talking_style=stable`` → декартово произведение вариантов."""
+    axes: dict[str, list[str]] = {}
+    for part in args.split():
+        key, sep, values = part.partition("=")
+        if not sep or key not in FANOUT_FIELDS:
+            raise ValueError(f"Неизвестный параметр: {part}")
+        if key in axes:
+            raise ValueError(f"Параметр {key} указан дважды")
+        axes[key] = [v for v in values.split(",") if v]
+        if not axes[key]:
+            raise ValueError(f"Нет значений для {key}")
+    if not axes:
+        raise ValueError("Нет вариантов")
+    variants = [dict(zip(axes, combo)) for combo in itertools.product(*axes.values())]
+    if len(variants) > MAX_VARIANTS:
+        raise ValueError(f"Слишком много вариантов: {len(variants)} > {MAX_VARIANTS}")
+    return variants
+
+
+def variant_label(variant: dict) -> str:
+    return ", ".join(f"{k}={v}" for k, v in variant.items())
+
+
+async def render_variant(client: httpx.AsyncClient, tp_id: str, text: str, voice_id: str,
+                         variant: dict) -> bytes:
+    opts = dict(variant)
+    res = await create_video(client, tp_id, text, opts.pop("voice_id", voice_id), **opts)
+    url = await wait_video_url(client, res.video_id)
+    # место на диске нужно только на скачивание и транскодирование; готовый
+    # клип (пара МБ) ждёт остальные варианты в памяти, не занимая квоту
+    async with workspace.MANAGER.job() as ws:
+        tmp_in = ws.file("in.mp4")
+        tmp_out = ws.file("out.mp4")
+        await download_video(client, url, tmp_in)
+        await ffmpeg_square_640(tmp_in, tmp_out)
+        return await asyncio.to_thread(tmp_out.read_bytes)
+
+
+async def run_fanout(m: Message, client: httpx.AsyncClient, tp_id: str, text: str,
+                     voice_id: str, variants: list[dict]) -> int:
+    """Все варианты рендерятся и транскодируются конкурентно на общем talking_photo_id.
+    Возвращает число отправленных вариантов."""
+    results = await asyncio.gather(
+        *(render_variant(client, tp_id, text, voice_id, v) for v in variants),
+        return_exceptions=True,
+    )
+    ok = [(v, data) for v, data in zip(variants, results) if isinstance(data, bytes)]
+    for v, e in zip(variants, results):
+        if isinstance(e, BaseException):
+            await m.reply(f"Вариант {variant_label(v)} не получился: {e}")
+    if len(ok) == 1:
+        await bot.send_video(chat_id=m.chat.id, video=BufferedInputFile(ok[0][1], "variant.mp4"),
+                             caption=variant_label(ok[0][0]))
+    elif ok:
+        await bot.send_media_group(chat_id=m.chat.id, media=[
+            InputMediaVideo(media=BufferedInputFile(data, f"variant_{i}.mp4"), caption=variant_label(v))
+            for i, (v, data) in enumerate(ok)
+        ])
+    return len(ok)
+
+
+async def check_heygen_key(client: httpx.AsyncClient) -> dict:
+    r = await client.get(f"{API_BASE}/v2/user/remaining_quota", headers=HEADERS)
+    if r.status_code in (401, 403):
+        raise RuntimeError(f"HeyGen API key rejected: HTTP {r.status_code}")
+    r.raise_for_status()
+    return (r.json() or {}).get("data") or {}
+
+
+async def check_voice(client: httpx.AsyncClient) -> str:
+    """Проверяет HEYGEN_VOICE_ID по каталогу /v2/voices; без него выбирает ru-голос."""
+    if not DEFAULT_VOICE_ID:
+        voice_id = await pick_ru_voice(client)
+        if not voice_id:
+            raise RuntimeError("no voice available for TTS")
+        return voice_id
+    r = await client.get(f"{API_BASE}/v2/voices", headers=HEADERS)
+    r.raise_for_status()
+    j = r.json() or {}
+    voices = (j.get("data") or {}).get("voices") or j.get("voices") or []
+    if DEFAULT_VOICE_ID not in {v.get("voice_id") for v in voices if isinstance(v, dict)}:
+        raise RuntimeError(f"HEYGEN_VOICE_ID {DEFAULT_VOICE_ID} not found in voice catalog")
+    return DEFAULT_VOICE_ID
+
+
+async def warm_up(client: httpx.AsyncClient) -> None:
+    # ответ не важен: нужно лишь пройти DNS + TLS и оставить соединение в пуле
+    await asyncio.gather(*(client.head(base) for base in (API_BASE, UPLOAD_BASE, "https://api.telegram.org")))
+
+
+@dp.startup()
+async def on_startup(bot: Bot) -> None:
+    """Префлайт до начала поллинга: первая задача после деплоя не платит за холодный старт."""
+    client = get_client()
+    await STARTUP.run(
+        {
+            "ffmpeg": lambda: startup.check_binary("ffmpeg"),
+            "ffprobe": lambda: startup.check_binary("ffprobe"),
+            "heygen_key": lambda: check_heygen_key(client),
+            "voice": lambda: check_voice(client),
+            "warm": lambda: warm_up(client),
+            "telegram": bot.get_me,
+            "workspace_sweep": lambda: asyncio.to_thread(workspace.MANAGER.sweep),
+        },
+        fatal=("ffmpeg", "heygen_key", "telegram"),
+    )
+    STARTUP.report()
+    # следим за блокировками цикла событий с первой секунды
+    loopmon.MONITOR.start()
+
+
+@dp.shutdown()
+async def on_shutdown() -> None:
+    loopmon.MONITOR.stop()
+    if _client is not None:
+        await _client.aclose()
+
+
+@dp.message(Command("health"))
+async def on_health(m: Message):
+    """Состояние circuit breaker'ов, хеджей по эндпоинтам HeyGen, нагрузки и цикла событий.
+    Только для ADMIN_IDS."""
+    if m.from_user.id not in ADMIN_IDS:
+        return
+    await m.reply(json.dumps(
+        {
+            "endpoints": resilience.snapshot(),
+            "load": load_policy.POLICY.snapshot(),
+            "workspace": workspace.MANAGER.snapshot(),
+            "loop": loopmon.MONITOR.snapshot(),
+        },
+        indent=2,
+    ))
+
+
+@dp.message(Command("profile"))
+async def on_profile(m: Message, command: CommandObject):
+    """``/profile start|stop`` — сэмплирующий профайлер без рестарта, только для ADMIN_IDS."""
+    if m.from_user.id not in ADMIN_IDS:
+        return
+    if command.args == "start":
+        loopmon.PROFILER.start()
+        await m.reply("Профайлер запущен. /profile stop — остановить и получить стеки.")
+    elif command.args == "stop" and loopmon.PROFILER.running:
+        async with workspace.MANAGER.job() as ws:
+            path = ws.file("profile.folded")
+            samples = await asyncio.to_thread(loopmon.PROFILER.stop, path)
+            await m.answer_document(
+                FSInputFile(path), caption=f"{samples} сэмплов, folded-стеки для flamegraph"
+            )
+    else:
+        await m.reply("Использование: /profile start | /profile stop")
+
+
 @dp.message(CommandStart())
 async def on_start(m: Message):
     USER_CTX[m.from_user.id] = {"stage": "await_photo"}
@@ -171,6 +398,18 @@ async def on_start(m: Message):
     )
 
 
+@dp.message(Command("fanout"))
+async def on_fanout(m: Message, command: CommandObject):
+    """Несколько вариантов одного фото и текста, напр. ``/fanout emotion=Excited,Serious``."""
+    try:
+        variants = parse_variants(command.args or "")
+    except ValueError as e:
+        return await m.reply(f"{e}. Пример: /fanout emotion=Excited,Serious talking_style=expressive,stable")
+    ctx = USER_CTX.setdefault(m.from_user.id, {})
+    ctx["variants"] = variants
+    await m.reply(f"Вариантов: {len(variants)}. Пришли фото и текст — отрендерю все сразу.")
+
+
 @dp.message(F.photo | F.document)
 async def on_photo(m: Message):
     ctx = USER_CTX.setdefault(m.from_user.id, {})
@@ -189,10 +428,9 @@ async def on_photo(m: Message):
 
     # загружаем байты
     url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        content = resp.content
+    resp = await get_client().get(url)
+    resp.raise_for_status()
+    content = resp.content
 
     # MIME
     mime = "image/jpeg"
@@ -216,19 +454,50 @@ async def on_text(m: Message):
     if not text:
         return await m.reply("Пустой текст. Пришли нормальный текст, пожалуйста.")
 
-    await m.reply("Генерирую видео… Обычно это 1–3 минуты.")
-
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        # выбрать голос
-        voice_id = await pick_ru_voice(client)
-        if not voice_id:
-            return await m.reply("Не нашёл голос для TTS. Попробуй позже.")
-
-        # загрузить talking photo
+    with jobtrace.RECORDER.job(len(ctx.get("photo_bytes") or b""), len(text)) as trace:
         try:
+            with load_policy.POLICY.job():
+                await m.reply("Генерирую видео… Обычно это 1–3 минуты.")
+                await render_job(m, ctx, text, trace)
+            if trace.outcome == "incomplete":
+                # render_job уже ответил пользователю ошибкой и вышел
+                trace.outcome = "error"
+        except load_policy.Overloaded as e:
+            trace.outcome = "shed"
+            await m.reply(str(e))
+
+
+async def render_job(m: Message, ctx: dict, text: str, trace: jobtrace.JobTrace):
+    client = get_client()
+    # выбрать голос
+    voice_id = await pick_ru_voice(client)
+    if not voice_id:
+        return await m.reply("Не нашёл голос для TTS. Попробуй позже.")
+
+    # загрузить talking photo
+    try:
+        with trace.phase("upload"):
             tp_id = await upload_talking_photo(client, ctx["photo_bytes"], ctx["photo_mime"])
+    except Exception as e:
+        return await m.reply("Не вышло загрузить фото в HeyGen. Попробуй другое фото.")
+    # fan-out: все варианты на одном talking_photo_id
+    if ctx.get("variants"):
+        trace.variants = len(ctx["variants"])
+        try:
+            with trace.phase("fanout"):
+                sent = await run_fanout(m, client, tp_id, text, voice_id, ctx["variants"])
         except Exception as e:
-            return await m.reply("Не вышло загрузить фото в HeyGen. Попробуй другое фото.")
+            logger.exception("fanout failed")
+            ctx.clear()
+            return await m.reply(f"Не получилось отрендерить варианты: {e}. Пришли фото заново.")
+        ctx.clear()
+        if not sent:
+            trace.outcome = "error"
+            return await m.reply("Ни один вариант не получился. Пришли фото заново и попробуй ещё раз.")
+        trace.outcome = "sent"
+        return await m.reply("Готово! Хочешь сделать ещё один клип? Пришли новое фото.")
+
+    with trace.phase("render_wait"):
         # создать видео
         try:
             res = await create_video(client, tp_id, text, voice_id)
@@ -236,48 +505,41 @@ async def on_text(m: Message):
             # типичные причины: лимиты, модерация, неверный voice_id. ([docs.heygen.com](https://docs.heygen.com/reference/limits?utm_source=chatgpt.com), [docs.heygen.com](https://docs.heygen.com/reference/video-status?utm_source=chatgpt.com))
             return await m.reply(f"Ошибка генерации в HeyGen: {e}")
 
-        # ждать готовности (поллинг с backoff; можно заменить на вебхуки)
-        url = None
-        for delay in (3, 5, 8, 13, 21, 34):
-            await asyncio.sleep(delay)
-            try:
-                url = await get_video_url(client, res.video_id)
-            except Exception as e:
-                return await m.reply(f"Ошибка получения статуса: {e}")
-            if url:
-                break
-        if not url:
+        # ждать готовности
+        try:
+            url = await wait_video_url(client, res.video_id)
+        except TimeoutError:
             return await m.reply("Слишком долго генерируется. Попробуй позже.")
+        except Exception as e:
+            return await m.reply(f"Ошибка получения статуса: {e}")
+
+    # скачать видео
+    async with workspace.MANAGER.job() as ws:
+        tmp_in = ws.file("in.mp4")
+        tmp_out = ws.file("out_640.mp4")
+        with trace.phase("download"):
+            await download_video(client, url, tmp_in)
 
-        # скачать видео
-        with tempfile.TemporaryDirectory() as td:
-            tmp_in = Path(td) / "in.mp4"
-            tmp_out = Path(td) / "out_640.mp4"
-            async with client.stream("GET", url) as r:
-                r.raise_for_status()
-                with open(tmp_in, "wb") as f:
-                    async for chunk in r.aiter_bytes():
-                        f.write(chunk)
-
-            # конвертация в кружок (квадрат 640×640, baseline)
-            try:
+        # конвертация в кружок (квадрат 640×640, baseline)
+        try:
+            with trace.phase("transcode"):
                 await ffmpeg_square_640(tmp_in, tmp_out)
-            except Exception as e:
-                return await m.reply(f"Ошибка ffmpeg: {e}")
+        except Exception as e:
+            return await m.reply(f"Ошибка ffmpeg: {e}")
 
-            # отправка как video note (по URL нельзя). ([hackage.haskell.org](https://hackage.haskell.org/package/telegram-bot-api/docs/Telegram-Bot-API-Methods-SendVideoNote.html?utm_source=chatgpt.com))
+        # отправка как video note (по URL нельзя). ([hackage.haskell.org](https://hackage.haskell.org/package/telegram-bot-api/docs/Telegram-Bot-API-Methods-SendVideoNote.html?utm_source=chatgpt.com))
+        with trace.phase("send"):
             with open(tmp_out, "rb") as f:
                 await bot.send_video_note(chat_id=m.chat.id, video_note=f, length=640)
+        trace.outcome = "sent"
 
     ctx.clear()
     await m.reply("Готово! Хочешь сделать ещё один клип? Пришли новое фото.")
 
 
 def main():
-    # Быстрая проверка наличия ffmpeg
-    if shutil.which("ffmpeg") is None:
-        print("ffmpeg не найден в PATH", file=sys.stderr)
-        sys.exit(1)
+    # ffmpeg/ffprobe, ключ HeyGen и Telegram проверяются в on_startup
+    logging.basicConfig(level=logging.INFO)
     dp.run_polling(bot)
 
 
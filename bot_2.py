@@ -8,6 +8,9 @@ from aiogram import Bot, Dispatcher, types
 from aiogram.types import ContentType
 from aiogram.utils import executor
 
+import loopmon
+import workspace
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -78,33 +81,38 @@ class TelegramBot:
             await message.reply("Пожалуйста, отправьте фото с текстом в подписи.")
             return
 
-        # Save photo to temp file
+        # Save photo to the job's scratch directory (removed on exit)
         photo = message.photo[-1]
-        download_path = f"temp_{photo.file_id}.jpg"
-        await photo.download(destination_file=download_path)
-        logger.info(f"Image downloaded to {download_path}")
-
-        try:
-            # Use photo file name as talking_photo_id for simplicity
-            talking_photo_id = os.path.splitext(os.path.basename(download_path))[0]
-            video_bytes = self.heygen.generate_video(talking_photo_id, script)
-
-            # Send video
-            video_io = BytesIO(video_bytes)
-            video_io.name = "output.mp4"
-            await message.reply_video(video=video_io)
-        except Exception as e:
-            logger.error(f"Error: {e}")
-            await message.reply("Не удалось сгенерировать видео.")
-        finally:
-            if os.path.exists(download_path):
-                os.remove(download_path)
+        async with workspace.MANAGER.job() as ws:
+            download_path = ws.file(f"temp_{photo.file_id}.jpg")
+            await photo.download(destination_file=str(download_path))
+            logger.info(f"Image downloaded to {download_path}")
+
+            try:
+                # Use photo file name as talking_photo_id for simplicity
+                talking_photo_id = download_path.stem
+                video_bytes = self.heygen.generate_video(talking_photo_id, script)
+
+                # Send video
+                video_io = BytesIO(video_bytes)
+                video_io.name = "output.mp4"
+                await message.reply_video(video=video_io)
+            except Exception as e:
+                logger.error(f"Error: {e}")
+                await message.reply("Не удалось сгенерировать видео.")
 
     def run(self):
         """
         Start the Telegram polling loop.
         """
-        executor.start_polling(self.dp, skip_updates=True)
+        workspace.MANAGER.sweep()
+        executor.start_polling(self.dp, skip_updates=True, on_startup=self.on_startup)
+
+    async def on_startup(self, dp: Dispatcher):
+        """
+        Start the event-loop lag monitor once the loop is running.
+        """
+        loopmon.MONITOR.start()
 
 if __name__ == '__main__':
     load_dotenv()
@@ -1,50 +1,218 @@
-import requests
-import json
-from typing import Optional, Dict, Any
+import asyncio
 import logging
+import random
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://api.heygen.com/v1"
+DEFAULT_VOICE_ID = "1bd001e7e50f421d891986aad5158bc8"  # English male
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, read=60.0)
+DEFAULT_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=300)
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD"})
+
+
+class HeyGenError(RuntimeError):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter for transport errors and retryable statuses.
+
+    Non-idempotent requests (POST /video/generate) are retried only when the
+    request provably never reached the server: a failed or timed-out connect,
+    or a 429 rejection. Anything else could create a duplicate render.
+    """
+    attempts: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 8.0
+    retry_statuses: tuple = (429, 500, 502, 503, 504)
+    unsent_errors: tuple = (httpx.ConnectError, httpx.ConnectTimeout)
+    unsent_statuses: tuple = (429,)
+
+    def __post_init__(self) -> None:
+        if self.attempts < 1:
+            raise ValueError(f"RetryPolicy.attempts must be >= 1, got {self.attempts}")
+
+    def should_retry(self, method: str, error: Optional[Exception] = None, status: Optional[int] = None) -> bool:
+        if method in IDEMPOTENT_METHODS:
+            return error is not None or status in self.retry_statuses
+        if error is not None:
+            return isinstance(error, self.unsent_errors)
+        return status in self.unsent_statuses
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+@dataclass(frozen=True)
+class ImageToVideoRequest:
+    image_url: str
+    text: str
+    voice_id: str = DEFAULT_VOICE_ID
+    video_config: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class VideoResult:
+    video_id: str = ""
+    status: str = "pending"
+    video_url: Optional[str] = None
+    error: Optional[str] = None
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_json(cls, js: Dict[str, Any]) -> "VideoResult":
+        data = js.get("data") or {}
+        return cls(
+            video_id=data.get("video_id") or "",
+            status=data.get("status") or js.get("status") or "pending",
+            video_url=data.get("video_url"),
+            error=data.get("error"),
+            raw=js,
+        )
+
+
+_shared_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def shared_client() -> httpx.AsyncClient:
+    """
+    Connection pool shared by every handler without its own transport.
+
+    Pooled connections belong to the event loop that opened them, so there is
+    one pool per running loop; a pool from a finished loop is never reused.
+    """
+    loop = asyncio.get_running_loop()
+    client = _shared_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _shared_clients[loop] = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS)
+    return client
+
+
+async def aclose_shared() -> None:
+    """
+    Close the shared pool of the running loop.
+    """
+    client = _shared_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
 
 class HeyGenHandler:
     """
-    A class to handle interactions with the HeyGen API for image-to-video conversion.
+    Async client for the HeyGen v1 image-to-video API.
     """
-    
-    def __init__(self, api_key: str, api_url: str = "https://api.heygen.com/v1"):
+
+    def __init__(
+        self,
+        api_key: str,
+        api_url: str = DEFAULT_API_URL,
+        *,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        retry: RetryPolicy = RetryPolicy(),
+    ):
         """
         Initialize the HeyGen API handler.
-        
+
         Args:
             api_key: Your HeyGen API key
             api_url: Base URL for HeyGen API (defaults to v1)
+            transport: Custom httpx transport (e.g. FakeHeyGen().transport in tests);
+                without it requests go through the shared connection pool
+            timeout: Per-request timeout
+            retry: Retry policy for transport errors and retryable statuses
         """
         self.api_key = api_key
-        self.api_url = api_url
-        self.headers = {
-            "X-Api-Key": api_key,
-            "Content-Type": "application/json",
-        }
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
-        logging.basicConfig(level=logging.INFO)
-        self.logger = logging.getLogger(__name__)
-
-    def create_video_from_image_and_text(
-        self, 
-        image_url: str, 
-        text: str, 
-        voice_id: str = "1bd001e7e50f421d891986aad5158bc8",  # Default voice ID
-        video_config: Optional[Dict[str, Any]] = None
-    ) -> Optional[str]:
+        self.api_url = api_url.rstrip("/")
+        self.headers = {"X-Api-Key": api_key}
+        self.timeout = timeout
+        self.retry = retry
+        self._own_client = (
+            httpx.AsyncClient(transport=transport, timeout=timeout)
+            if transport is not None
+            else None
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        The handler's own client, or the shared pool of the running loop.
+        """
+        return self._own_client if self._own_client is not None else shared_client()
+
+    async def aclose(self) -> None:
+        if self._own_client is not None:
+            await self._own_client.aclose()
+
+    async def __aenter__(self) -> "HeyGenHandler":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        url = f"{self.api_url}{path}"
+        for attempt in range(self.retry.attempts):
+            last = attempt == self.retry.attempts - 1
+            try:
+                response = await self.client.request(
+                    method, url, headers=self.headers, timeout=self.timeout, **kwargs
+                )
+            except httpx.TransportError as e:
+                if last or not self.retry.should_retry(method, error=e):
+                    raise HeyGenError(f"Request failed: {e}") from e
+                logger.warning(f"{method} {path}: {e}, retrying")
+            else:
+                if last or not self.retry.should_retry(method, status=response.status_code):
+                    break
+                logger.warning(f"{method} {path}: HTTP {response.status_code}, retrying")
+            await asyncio.sleep(self.retry.delay(attempt))
+
+        try:
+            result = response.json()
+        except ValueError as e:
+            if response.status_code >= 400:
+                raise HeyGenError(f"HeyGen API error: {response.text}", response.status_code) from e
+            raise HeyGenError(f"Failed to parse response: {e}", response.status_code) from e
+        if response.status_code >= 400:
+            message = None
+            if isinstance(result, dict):
+                message = result.get("message") or result.get("error")
+            raise HeyGenError(f"HeyGen API error: {message or response.text}", response.status_code)
+        if not isinstance(result, dict):
+            raise HeyGenError(f"Unexpected response: {response.text}", response.status_code)
+        return result
+
+    async def create_video_from_image_and_text(
+        self,
+        image_url: str,
+        text: str,
+        voice_id: str = DEFAULT_VOICE_ID,
+        video_config: Optional[Dict[str, Any]] = None,
+    ) -> VideoResult:
         """
         Create a video from an image and text using HeyGen API.
-        
+
         Args:
             image_url: URL of the image to use
             text: Text to convert to speech
             voice_id: ID of the voice to use (default is English male)
             video_config: Additional video configuration options
-            
+
         Returns:
-            URL of the generated video or None if failed
+            VideoResult with the video URL, or the video_id to poll with wait_for_video
         """
         if video_config is None:
             video_config = {
@@ -63,25 +231,110 @@ class HeyGenHandler:
             "video_config": video_config
         }
 
-        try:
-            response = self.session.post(
-                f"{self.api_url}/video/generate",
-                data=json.dumps(payload)
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("status") == "success":
-                video_url = result.get("data", {}).get("video_url")
-                self.logger.info(f"Video created successfully: {video_url}")
-                return video_url
-            else:
-                self.logger.error(f"HeyGen API error: {result.get('message')}")
-                return None
-                
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"Request failed: {str(e)}")
-            return None
-        except json.JSONDecodeError as e:
-            self.logger.error(f"Failed to parse response: {str(e)}")
-            return None
\ No newline at end of file
+        result = await self._request("POST", "/video/generate", json=payload)
+        if result.get("status") not in (None, "success"):
+            raise HeyGenError(f"HeyGen API error: {result.get('message')}")
+        video = VideoResult.from_json(result)
+        if video.video_url:
+            logger.info(f"Video created successfully: {video.video_url}")
+        else:
+            logger.info(f"Video queued: {video.video_id}")
+        return video
+
+    async def get_video_status(self, video_id: str) -> VideoResult:
+        result = await self._request("GET", "/video_status.get", params={"video_id": video_id})
+        return VideoResult.from_json(result)
+
+    async def wait_for_video(
+        self,
+        video: VideoResult,
+        delays: Iterable[float] = (3, 5, 8, 13, 21, 34),
+    ) -> VideoResult:
+        """
+        Poll until the video has a URL or fails.
+        """
+        for delay in delays:
+            if video.video_url or video.status in {"failed", "error"}:
+                break
+            await asyncio.sleep(delay)
+            video = await self.get_video_status(video.video_id)
+        if video.status in {"failed", "error"}:
+            raise HeyGenError(f"Render failed: {video.error or video.raw}")
+        if not video.video_url:
+            raise HeyGenError("Timeout: video is not ready")
+        return video
+
+    async def create_videos(
+        self,
+        requests: Iterable[ImageToVideoRequest],
+        concurrency: int = 8,
+        wait: bool = True,
+        delays: Iterable[float] = (3, 5, 8, 13, 21, 34),
+    ) -> List[Union[VideoResult, HeyGenError]]:
+        """
+        Submit many image-to-video requests concurrently over the shared pool.
+
+        Args:
+            requests: Requests to submit
+            concurrency: Maximum requests in flight
+            wait: Also poll every video until it is ready
+            delays: Poll schedule passed to wait_for_video
+
+        Returns:
+            One VideoResult or HeyGenError per request, in input order
+        """
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(req: ImageToVideoRequest) -> VideoResult:
+            async with sem:
+                video = await self.create_video_from_image_and_text(
+                    req.image_url, req.text, req.voice_id, req.video_config
+                )
+            return await self.wait_for_video(video, delays) if wait else video
+
+        results = await asyncio.gather(*(one(r) for r in requests), return_exceptions=True)
+        for r in results:
+            if isinstance(r, BaseException) and not isinstance(r, HeyGenError):
+                raise r
+        return results
+
+
+class FakeHeyGen:
+    """
+    In-memory HeyGen v1 for tests and benchmarks:
+    HeyGenHandler("key", transport=FakeHeyGen(render_time=1).transport).
+    """
+
+    def __init__(self, latency: float = 0.0, render_time: float = 0.0, fail_every: int = 0):
+        self.latency = latency
+        self.render_time = render_time
+        self.fail_every = fail_every
+        self.requests = 0
+        self._ready_at: Dict[str, float] = {}
+
+    @property
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if self.fail_every and self.requests % self.fail_every == 0:
+            return httpx.Response(503, json={"message": "fake outage"})
+        loop = asyncio.get_running_loop()
+        if request.url.path.endswith("/video/generate"):
+            video_id = f"fake-{self.requests}"
+            self._ready_at[video_id] = loop.time() + self.render_time
+            return httpx.Response(200, json={"status": "success", "data": {"video_id": video_id}})
+        if request.url.path.endswith("/video_status.get"):
+            video_id = request.url.params.get("video_id", "")
+            if video_id not in self._ready_at:
+                return httpx.Response(404, json={"message": f"unknown video {video_id}"})
+            if loop.time() < self._ready_at[video_id]:
+                return httpx.Response(200, json={"data": {"video_id": video_id, "status": "processing"}})
+            return httpx.Response(200, json={"data": {
+                "video_id": video_id,
+                "status": "completed",
+                "video_url": f"https://fake.heygen/{video_id}.mp4",
+            }})
+        return httpx.Response(404, json={"message": "not found"})
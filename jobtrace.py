@@ -0,0 +1,79 @@
+"""Запись анонимных таймингов задач для последующего воспроизведения нагрузки.
+
+Включается переменной ``TRACE_FILE``: на каждую задачу в файл дописывается
+строка JSONL с моментом прихода, размером фото, длиной текста и длительностью
+фаз (upload, render_wait, download, transcode, send). Ни id пользователя, ни
+сам текст не пишутся. Файл воспроизводит ``replay.py``.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JobTrace:
+    arrival: float
+    photo_size: int
+    text_len: int
+    phases: dict[str, float] = field(default_factory=dict)
+    variants: int = 1
+    outcome: str = "incomplete"
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+class Recorder:
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @contextmanager
+    def job(self, photo_size: int, text_len: int) -> Iterator[JobTrace]:
+        """Трейс задачи; пишется в файл при выходе, если запись включена."""
+        trace = JobTrace(arrival=time.time(), photo_size=photo_size, text_len=text_len)
+        try:
+            yield trace
+        except BaseException:
+            trace.outcome = "error"
+            raise
+        finally:
+            if self.enabled:
+                self._write(trace)
+
+    def _write(self, trace: JobTrace) -> None:
+        record = asdict(trace)
+        record["phases"] = {k: round(v, 3) for k, v in trace.phases.items()}
+        line = json.dumps(record, separators=(",", ":"))
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning("trace write failed: %s", e)
+
+
+def load(path: str) -> list[JobTrace]:
+    with open(path, encoding="utf-8") as f:
+        traces = [JobTrace(**json.loads(line)) for line in f if line.strip()]
+    return sorted(traces, key=lambda t: t.arrival)
+
+
+RECORDER = Recorder(os.environ.get("TRACE_FILE"))
@@ -0,0 +1,145 @@
+"""Адаптация качества кодирования под нагрузку и сброс новых задач.
+
+Уровень нагрузки считается по глубине очереди транскодирования (ждущие +
+выполняющиеся) и loadavg на ядро. Под давлением пресет опускается до
+ultrafast, в простое кодируем медленнее и качественнее.
+
+Новые задачи сбрасываются, когда очередь транскодирования глубже
+``SHED_AFTER_QUEUE``: большая часть жизни задачи — ожидание рендера HeyGen,
+которое почти ничего не стоит, поэтому число активных задач само по себе не
+признак перегрузки. Отдельный, намного более высокий ``MAX_ACTIVE_JOBS``
+ограничивает задачи в полёте целиком (память под фото и воркспейсы).
+Пользователь получает понятное сообщение, а его фото и состояние сохраняются
+для повторной попытки.
+
+Переменные окружения: ``TRANSCODE_WORKERS`` (параллельных кодирований),
+``SHED_AFTER_QUEUE`` (порог очереди транскодирования, по умолчанию
+4 × workers), ``MAX_ACTIVE_JOBS`` (по умолчанию 50 × workers).
+"""
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+import os
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Iterator
+
+logger = logging.getLogger(__name__)
+
+IDLE = "idle"
+NORMAL = "normal"
+BUSY = "busy"
+OVERLOADED = "overloaded"
+
+# пресеты libx264 от быстрых к медленным
+PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow")
+
+SHED_MESSAGE = (
+    "Сейчас слишком много задач в очереди ({active}). "
+    "Попробуй ещё раз через пару минут — фото я запомнил, просто пришли текст снова."
+)
+
+
+class Overloaded(RuntimeError):
+    pass
+
+
+def _shift_preset(preset: str, steps: int) -> str:
+    if preset not in PRESETS:
+        return preset
+    i = min(max(PRESETS.index(preset) + steps, 0), len(PRESETS) - 1)
+    return PRESETS[i]
+
+
+def cpu_load() -> float:
+    """loadavg за минуту на одно ядро; 0, если платформа его не даёт."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+class LoadPolicy:
+    def __init__(self, workers: int = 0, shed_after: int = 0, max_jobs: int = 0):
+        self.workers = workers or os.cpu_count() or 2
+        self.shed_after = shed_after or self.workers * 4
+        self.max_jobs = max_jobs or self.workers * 50
+        self.transcode_depth = 0
+        self.active_jobs = 0
+        self._slots = asyncio.Semaphore(self.workers)
+
+    def level(self) -> str:
+        load = cpu_load()
+        if self.transcode_depth >= 2 * self.workers or load > 1.5:
+            return OVERLOADED
+        if self.transcode_depth > self.workers or load > 1.0:
+            return BUSY
+        if self.transcode_depth <= 1 and load < 0.5:
+            return IDLE
+        return NORMAL
+
+    def adapt(self, spec: Any) -> Any:
+        """Возвращает копию TranscodeSpec с пресетом/CRF/потоками под текущую нагрузку."""
+        level = self.level()
+        if level == IDLE:
+            return dataclasses.replace(
+                spec, preset=_shift_preset(spec.preset, +1), crf=max(spec.crf - 2, 0)
+            )
+        if level == BUSY:
+            return dataclasses.replace(
+                spec,
+                preset=_shift_preset(spec.preset, -2),
+                crf=spec.crf + 2,
+                threads=max((os.cpu_count() or 1) // self.workers, 1),
+            )
+        if level == OVERLOADED:
+            return dataclasses.replace(
+                spec, preset="ultrafast", crf=spec.crf + 4, threads=1
+            )
+        return spec
+
+    @asynccontextmanager
+    async def transcode_slot(self) -> AsyncIterator[None]:
+        """Ограничивает параллельные кодирования; ожидающие считаются в глубину очереди."""
+        self.transcode_depth += 1
+        try:
+            async with self._slots:
+                yield
+        finally:
+            self.transcode_depth -= 1
+
+    def overloaded(self) -> bool:
+        return self.transcode_depth >= self.shed_after or self.active_jobs >= self.max_jobs
+
+    @contextmanager
+    def job(self) -> Iterator[None]:
+        if self.overloaded():
+            logger.warning(
+                "shedding job: transcode queue %s (limit %s), active %s (limit %s)",
+                self.transcode_depth, self.shed_after, self.active_jobs, self.max_jobs,
+            )
+            queued = self.transcode_depth if self.transcode_depth >= self.shed_after else self.active_jobs
+            raise Overloaded(SHED_MESSAGE.format(active=queued))
+        self.active_jobs += 1
+        try:
+            yield
+        finally:
+            self.active_jobs -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "level": self.level(),
+            "transcode_depth": self.transcode_depth,
+            "active_jobs": self.active_jobs,
+            "shed_after": self.shed_after,
+            "max_jobs": self.max_jobs,
+            "cpu_load": round(cpu_load(), 2),
+        }
+
+
+POLICY = LoadPolicy(
+    workers=int(os.environ.get("TRANSCODE_WORKERS", "0")),
+    shed_after=int(os.environ.get("SHED_AFTER_QUEUE", "0")),
+    max_jobs=int(os.environ.get("MAX_ACTIVE_JOBS", "0")),
+)
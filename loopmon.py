@@ -0,0 +1,149 @@
+"""Мониторинг задержек event loop и сэмплирующий профайлер по запросу.
+
+``LagMonitor`` раз в ``interval`` отмечается из корутины на цикле событий, а
+сторожевой поток проверяет эти отметки. Если цикл не отвечает дольше
+``threshold`` (кто-то вызвал блокирующий subprocess.run, синхронный httpx,
+requests, ``open().read()``…), в лог пишется стек потока цикла в момент
+блокировки — сразу видно виновника.
+
+``SamplingProfiler`` запускается и останавливается без рестарта бота и пишет
+стеки в свёрнутом формате (``a;b;c 42``), который понимают flamegraph.pl,
+speedscope и inferno.
+
+Переменные окружения: ``LOOP_LAG_THRESHOLD_MS`` (по умолчанию 200).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LagMonitor:
+    def __init__(self, threshold: float = 0.2, interval: float = 0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # иначе быстрый stop/start оставит старый поток, пропустивший set/clear
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.max_lag = max(self.max_lag, now - expected)
+            self._beat = now
+
+    def _watchdog(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            lag = time.monotonic() - beat
+            if lag < self.threshold or beat == reported_beat:
+                continue
+            # один стек на одну блокировку, пока цикл не отметится снова
+            reported_beat = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+            logger.warning("event loop blocked for %.0fms, stack:\n%s", lag * 1000, stack)
+
+    def snapshot(self) -> dict:
+        return {
+            "max_lag_ms": round(self.max_lag * 1000),
+            "stalls": self.stalls,
+            "threshold_ms": round(self.threshold * 1000),
+        }
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Сэмплирует стеки всех потоков, кроме своего, с частотой ``hz``."""
+
+    def __init__(self, hz: int = 100):
+        self.hz = hz
+        self.samples: Counter[str] = Counter()
+        self.started_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.samples.clear()
+        self.started_at = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(1 / self.hz):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                self.samples[f"{names.get(ident, ident)};{_fold(frame)}"] += 1
+
+    def stop(self, path: Path) -> int:
+        """Останавливает сбор и пишет свёрнутые стеки в ``path``. Возвращает число сэмплов."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return sum(self.samples.values())
+
+
+MONITOR = LagMonitor(threshold=int(os.environ.get("LOOP_LAG_THRESHOLD_MS", "200")) / 1000)
+PROFILER = SamplingProfiler()
@@ -0,0 +1,173 @@
+"""Прогресс задачи одним статус-сообщением с общим бюджетом исходящих запросов.
+
+``ProgressReporter`` отправляет первое сообщение, а дальше правит его через
+``edit_message_text``; частые обновления склеиваются, в чат уходит только
+последний текст не чаще раза в ``min_interval`` секунд.
+
+Все запросы бота к Telegram проходят через ``BUDGET``: ``BudgetMiddleware``
+вешается на сессию (``bot.session.middleware(BudgetMiddleware())``) и берёт
+токен перед каждым вызовом Bot API, приоритет выбирается по методу. Доставка
+видео (``VIDEO``) обслуживается раньше обычных сообщений (``MESSAGE``), а те —
+раньше правок прогресса (``PROGRESS``).
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# меньше — важнее
+VIDEO = 0
+MESSAGE = 1
+PROGRESS = 2
+
+METHOD_PRIORITY = {
+    "sendVideoNote": VIDEO,
+    "sendVideo": VIDEO,
+    "sendMediaGroup": VIDEO,
+    "sendDocument": VIDEO,
+    "editMessageText": PROGRESS,
+}
+
+
+class SendBudget:
+    """Токен-бакет на все исходящие запросы бота с очередью по приоритету.
+
+    Глобальный лимит Telegram — около 30 сообщений в секунду, оставляем запас.
+    """
+
+    def __init__(self, rate: float = 25.0, burst: int = 5):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority: int = PROGRESS) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await fut
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self._tokens -= 1
+                fut.set_result(None)
+
+    def pending(self) -> int:
+        return len(self._waiters)
+
+
+BUDGET = SendBudget()
+
+
+class BudgetMiddleware(BaseRequestMiddleware):
+    """Каждый исходящий вызов Bot API ждёт токен из ``budget``.
+
+    ``get*`` (long polling, getFile, getMe) в лимит на отправку не входят и
+    идут без очереди.
+    """
+
+    def __init__(self, budget: SendBudget = BUDGET):
+        self.budget = budget
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        if not name.startswith("get"):
+            await self.budget.acquire(METHOD_PRIORITY.get(name, MESSAGE))
+        return await make_request(bot, method)
+
+
+class ProgressReporter:
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: int,
+        min_interval: float = 1.5,
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.message_id: Optional[int] = None
+        self._text: Optional[str] = None
+        self._shown: Optional[str] = None
+        self._last_edit = 0.0
+        self._flush: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def update(self, text: str) -> None:
+        """Запоминает новый текст; сама правка уйдёт не раньше ``min_interval``."""
+        self._text = text
+        if self.message_id is None:
+            await self._push()
+        elif self._flush is None or self._flush.done():
+            self._flush = asyncio.create_task(self._delayed_push())
+
+    async def finish(self, text: Optional[str] = None) -> None:
+        """Выставляет финальный текст и дожидается, пока он окажется в чате."""
+        if text is not None:
+            self._text = text
+        if self._flush is not None and not self._flush.done():
+            self._flush.cancel()
+        await self._push()
+
+    async def _delayed_push(self) -> None:
+        delay = self._last_edit + self.min_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._push()
+
+    async def _push(self) -> None:
+        async with self._lock:
+            text = self._text
+            if text is None or text == self._shown:
+                return
+            try:
+                if self.message_id is None:
+                    msg = await self.bot.send_message(self.chat_id, text)
+                    self.message_id = msg.message_id
+                else:
+                    await self.bot.edit_message_text(
+                        text, chat_id=self.chat_id, message_id=self.message_id
+                    )
+            except TelegramRetryAfter as e:
+                # прогресс не важнее видео: пропускаем правку, следующий update её догонит
+                logger.warning("progress edit throttled for %ss", e.retry_after)
+                return
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e):
+                    logger.warning("progress edit failed: %s", e)
+                return
+            finally:
+                self._last_edit = time.monotonic()
+            self._shown = text
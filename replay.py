@@ -0,0 +1,192 @@
+"""Воспроизведение записанных трейсов (jobtrace) против пайплайна bot_0.
+
+    python replay.py traces.jsonl --speed 10
+    python replay.py traces.jsonl --speed 1 --video sample.mp4
+
+Задачи приходят с теми же интервалами, что и в проде (ускоренными в
+``--speed`` раз), и проходят настоящий ``bot_0.on_text``: admission, воркспейсы,
+хеджи, breaker'ы, очередь транскодирования. HeyGen и Telegram заменены
+локальными фейками, которые отвечают с записанными задержками. Без ``--video``
+транскодирование тоже фейковое; с ним — настоящее, на реальной скорости.
+"""
+import argparse
+import asyncio
+import contextvars
+import os
+import statistics
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+# bot_0 читает ключи при импорте; фейковым бэкендам они не нужны
+os.environ.setdefault("BOT_TOKEN", "123456:replay")
+os.environ.setdefault("API_HEYGEN", "replay")
+os.environ.setdefault("HEYGEN_VOICE_ID", "replay-voice")
+
+import httpx
+
+import bot_0
+import jobtrace
+import load_policy
+import progress
+import transcode
+
+CURRENT: contextvars.ContextVar[jobtrace.JobTrace] = contextvars.ContextVar("CURRENT")
+
+
+def _scaled(phase: str, speed: float) -> float:
+    return CURRENT.get().phases.get(phase, 0.0) / speed
+
+
+class FakeHeygen:
+    """HeyGen в памяти: рендер готов через записанный render_wait."""
+
+    def __init__(self, speed: float, video: bytes):
+        self.speed = speed
+        self.video = video
+        self.ready_at: dict[str, float] = {}
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/v1/talking_photo":
+            await asyncio.sleep(_scaled("upload", self.speed))
+            return httpx.Response(200, json={"talking_photo_id": uuid.uuid4().hex})
+        if path == "/v2/video/generate":
+            video_id = uuid.uuid4().hex
+            self.ready_at[video_id] = time.monotonic() + _scaled("render_wait", self.speed)
+            return httpx.Response(200, json={"video_id": video_id})
+        if path == "/v1/video_status.get":
+            video_id = request.url.params["video_id"]
+            if time.monotonic() < self.ready_at[video_id]:
+                return httpx.Response(200, json={"status": "processing"})
+            return httpx.Response(200, json={
+                "status": "completed",
+                "video_url": f"https://fake.heygen/video/{video_id}.mp4",
+            })
+        if path.startswith("/video/"):
+            await asyncio.sleep(_scaled("download", self.speed))
+            return httpx.Response(200, content=self.video)
+        return httpx.Response(404)
+
+
+class FakeTelegram:
+    """Вместо сессии с BudgetMiddleware бюджет берётся здесь же, по тем же приоритетам."""
+
+    def __init__(self, speed: float):
+        self.speed = speed
+        self.delivered: set[int] = set()
+
+    async def _deliver(self, chat_id: int, **_) -> None:
+        await progress.BUDGET.acquire(progress.VIDEO)
+        await asyncio.sleep(_scaled("send", self.speed))
+        self.delivered.add(chat_id)
+
+    send_video_note = send_video = send_media_group = _deliver
+
+    async def send_message(self, chat_id: int, text: str, **_):
+        await progress.BUDGET.acquire(progress.MESSAGE)
+        return SimpleNamespace(message_id=1)
+
+    async def edit_message_text(self, text: str, **_) -> None:
+        await progress.BUDGET.acquire(progress.PROGRESS)
+
+
+class FakeTranscode:
+    name = "fake"
+
+    def __init__(self, speed: float):
+        self.speed = speed
+
+    async def transcode(self, src: Path, dst: Path, spec: transcode.TranscodeSpec) -> None:
+        await asyncio.sleep(_scaled("transcode", self.speed))
+        dst.write_bytes(src.read_bytes())
+
+
+class FakeMessage:
+    def __init__(self, job: int, text: str):
+        self.chat = SimpleNamespace(id=job)
+        self.from_user = SimpleNamespace(id=job)
+        self.text = text
+        self.replies: list[str] = []
+
+    async def reply(self, text: str, **_) -> None:
+        self.replies.append(text)
+
+
+async def run_job(job: int, trace: jobtrace.JobTrace, tg: FakeTelegram) -> tuple[float, str]:
+    CURRENT.set(trace)
+    bot_0.USER_CTX[job] = {
+        "stage": "await_text",
+        "photo_bytes": bytes(trace.photo_size),
+        "photo_mime": "image/jpeg",
+    }
+    m = FakeMessage(job, "x" * max(trace.text_len, 1))
+    started = time.monotonic()
+    await bot_0.on_text(m)
+    latency = time.monotonic() - started
+    if job in tg.delivered:
+        return latency, "sent"
+    shed_prefix = load_policy.SHED_MESSAGE.split("{")[0]
+    if any(r.startswith(shed_prefix) for r in m.replies):
+        return latency, "shed"
+    return latency, "failed"
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("traces")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение времени, 1 = как в проде")
+    parser.add_argument("--video", type=Path, help="клип для настоящего транскодирования")
+    parser.add_argument("--record", help="писать трейсы прогона в этот файл")
+    args = parser.parse_args()
+
+    traces = [t for t in jobtrace.load(args.traces) if t.outcome != "shed"]
+    # без отдельной фазы download (старые трейсы simple_bot, fan-out) скачивание
+    # сидит внутри render_wait, и фейковый HeyGen посчитал бы его дважды
+    usable = [t for t in traces if t.outcome != "sent" or "download" in t.phases]
+    if len(usable) < len(traces):
+        print(f"пропускаю {len(traces) - len(usable)} трейсов без фазы download")
+    traces = usable
+    if not traces:
+        raise SystemExit("нет трейсов")
+
+    video = args.video.read_bytes() if args.video else b"fake-mp4"
+    tg = FakeTelegram(args.speed)
+    bot_0.bot = tg
+    bot_0._client = httpx.AsyncClient(transport=httpx.MockTransport(FakeHeygen(args.speed, video)))
+    bot_0.POLL_DELAYS = tuple(d / args.speed for d in bot_0.POLL_DELAYS)
+    if not args.video:
+        transcode._backend = FakeTranscode(args.speed)
+    jobtrace.RECORDER.path = args.record
+
+    base = traces[0].arrival
+    started = time.monotonic()
+    tasks = []
+    for job, trace in enumerate(traces):
+        delay = (trace.arrival - base) / args.speed - (time.monotonic() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run_job(job, trace, tg)))
+    results = await asyncio.gather(*tasks)
+
+    # латентности в «продовом» времени, чтобы сравнивать с записью
+    replayed = [lat * args.speed for lat, outcome in results if outcome == "sent"]
+    recorded = [sum(t.phases.values()) for t in traces if t.outcome == "sent"]
+    outcomes = [outcome for _, outcome in results]
+    print(f"jobs={len(results)} " + " ".join(
+        f"{o}={outcomes.count(o)}" for o in ("sent", "shed", "failed")
+    ))
+    for name, values in (("recorded", recorded), ("replayed", replayed)):
+        if values:
+            print(f"{name:>9}: mean={statistics.mean(values):.1f}s "
+                  f"p50={_pct(values, 0.5):.1f}s p95={_pct(values, 0.95):.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,296 @@
+"""Хеджированные запросы и circuit breaker для эндпоинтов HeyGen.
+
+Каждый эндпоинт (``endpoint("heygen.video_status")``) держит свой breaker и
+скользящее окно латентностей. Идемпотентные запросы (статус рендера)
+хеджируются: если первый ответ не пришёл за p95, отправляется второй, и
+побеждает тот, что ответит раньше. Неидемпотентные (upload, generate) только
+проходят через breaker.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """Размыкается после ``failure_threshold`` ошибок подряд, через
+    ``reset_timeout`` секунд пропускает один пробный запрос (half-open)."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            logger.warning("circuit %s: %s -> %s", self.name, self._state, state)
+        self._state = state
+
+    def allow(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN:
+                retry_in = self.reset_timeout - (time.monotonic() - self._opened_at)
+                raise CircuitOpenError(
+                    f"{self.name} is unavailable, retry in {max(retry_in, 0):.0f}s"
+                )
+            if state == HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError(f"{self.name} is recovering, probe in flight")
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self) -> None:
+        """Возвращает пробный слот без учёта исхода (вызов отменён)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+            }
+
+
+class LatencyTracker:
+    """Скользящее окно латентностей; порог хеджа — заданный перцентиль."""
+
+    def __init__(
+        self,
+        window: int = 200,
+        percentile: float = 0.95,
+        default: float = 2.0,
+        min_samples: int = 10,
+    ):
+        self.percentile = percentile
+        self.default = default
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def threshold(self) -> float:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.default
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+
+
+class Endpoint:
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self.latency = LatencyTracker()
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def snapshot(self) -> dict:
+        return {
+            **self.breaker.snapshot(),
+            "hedge_after_s": round(self.latency.threshold(), 3),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+ENDPOINTS: dict[str, Endpoint] = {}
+_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+def endpoint(name: str) -> Endpoint:
+    ep = ENDPOINTS.get(name)
+    if ep is None:
+        ep = ENDPOINTS[name] = Endpoint(name)
+    return ep
+
+
+def snapshot() -> dict[str, dict]:
+    """Состояние всех эндпоинтов для мониторинга."""
+    return {name: ep.snapshot() for name, ep in ENDPOINTS.items()}
+
+
+def _record(ep: Endpoint, started: float, result: Optional[T], error: Optional[BaseException],
+            is_failure: Callable[[T], bool]) -> None:
+    if error is not None or is_failure(result):
+        ep.breaker.record_failure()
+    else:
+        ep.latency.observe(time.monotonic() - started)
+        ep.breaker.record_success()
+
+
+async def guarded(
+    ep: Endpoint,
+    call: Callable[[], Awaitable[T]],
+    is_failure: Callable[[T], bool] = lambda _: False,
+) -> T:
+    ep.breaker.allow()
+    started = time.monotonic()
+    try:
+        result = await call()
+    except Exception as e:
+        _record(ep, started, None, e, is_failure)
+        raise
+    except BaseException:
+        # отмена — не сбой эндпоинта, но пробный слот half-open надо вернуть
+        ep.breaker.release()
+        raise
+    _record(ep, started, result, None, is_failure)
+    return result
+
+
+async def hedged(
+    ep: Endpoint,
+    call: Callable[[], Awaitable[T]],
+    is_failure: Callable[[T], bool] = lambda _: False,
+) -> T:
+    """Отправляет второй запрос, если первый дольше перцентиля латентности.
+    Только для идемпотентных запросов."""
+    ep.breaker.allow()
+    started = time.monotonic()
+    settled = False
+    tasks = {asyncio.ensure_future(call())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=ep.latency.threshold())
+        hedge = None
+        if not done and ep.breaker.state == CLOSED:
+            ep.hedges += 1
+            hedge = asyncio.ensure_future(call())
+            tasks.add(hedge)
+        pending = tasks
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    result = task.result()
+                    if hedge is task:
+                        ep.hedge_wins += 1
+                    _record(ep, started, result, None, is_failure)
+                    settled = True
+                    return result
+                error = task.exception()
+        _record(ep, started, None, error, is_failure)
+        settled = True
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        if not settled:
+            ep.breaker.release()
+
+
+def guarded_sync(
+    ep: Endpoint,
+    call: Callable[[], T],
+    is_failure: Callable[[T], bool] = lambda _: False,
+) -> T:
+    ep.breaker.allow()
+    started = time.monotonic()
+    try:
+        result = call()
+    except Exception as e:
+        _record(ep, started, None, e, is_failure)
+        raise
+    except BaseException:
+        ep.breaker.release()
+        raise
+    _record(ep, started, result, None, is_failure)
+    return result
+
+
+def hedged_sync(
+    ep: Endpoint,
+    call: Callable[[], T],
+    is_failure: Callable[[T], bool] = lambda _: False,
+) -> T:
+    """Синхронный вариант ``hedged`` на пуле потоков. Проигравший запрос не
+    отменяется, его результат просто отбрасывается."""
+    ep.breaker.allow()
+    started = time.monotonic()
+    settled = False
+    try:
+        first = _pool.submit(call)
+        futures = {first}
+        hedge = None
+        try:
+            first.result(timeout=ep.latency.threshold())
+        except concurrent.futures.TimeoutError:
+            if ep.breaker.state == CLOSED:
+                ep.hedges += 1
+                hedge = _pool.submit(call)
+                futures.add(hedge)
+        except Exception:
+            pass
+        pending = futures
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    result = future.result()
+                    if hedge is future:
+                        ep.hedge_wins += 1
+                    _record(ep, started, result, None, is_failure)
+                    settled = True
+                    return result
+                error = future.exception()
+        _record(ep, started, None, error, is_failure)
+        settled = True
+        raise error
+    finally:
+        if not settled:
+            ep.breaker.release()
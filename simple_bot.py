@@ -1,29 +1,42 @@
+import startup
+import resilience
+import load_policy
+import progress
+import workspace
+import jobtrace
+import loopmon
+
+import asyncio
+import json
 import os
 from dotenv import load_dotenv
 import logging
-import httpx
-from pathlib import Path
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, ContentType, BufferedInputFile, FSInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-import VideoProcessor
-import HeygenProcessor
+# тяжелые модули (httpx и т.п.) импортируются при первом обращении
+VideoProcessor = startup.lazy_module("VideoProcessor")
+HeygenProcessor = startup.lazy_module("HeygenProcessor")
 
 load_dotenv()
 TOKEN = os.environ["BOT_TOKEN"]
 API_HEYGEN = os.environ["API_HEYGEN"]
 DEFAULT_VOICE_ID = os.environ["HEYGEN_VOICE_ID"]
-TIMEOUT = httpx.Timeout(30.0, read=60.0)
 HEADERS = {"x-api-key": API_HEYGEN}
 API_URL = "https://api.heygen.com"
 UPLOAD_ULR = "https://upload.heygen.com"
-print(TOKEN, API_HEYGEN)
+# кому доступны служебные команды (/health, /profile)
+ADMIN_IDS = {int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x.strip()}
+
+logger = logging.getLogger(__name__)
 
 bot = Bot(token=TOKEN)
+bot.session.middleware(progress.BudgetMiddleware())
 dp = Dispatcher()
+STARTUP = startup.Startup()
 
 TEMP_VIDEO_PATH = "simple.mp4"
 
@@ -35,6 +48,31 @@ class Form(StatesGroup):
     sending_video = State()
 
 
+@dp.startup()
+async def on_startup(bot: Bot) -> None:
+    """Префлайт до начала поллинга: первый пользователь не платит за DNS/TLS."""
+    processor = HeygenProcessor.HeygenProcessor()
+    client = HeygenProcessor.get_client()
+    await STARTUP.run(
+        {
+            "ffmpeg": lambda: startup.check_binary("ffmpeg"),
+            "ffprobe": lambda: startup.check_binary("ffprobe"),
+            "heygen_key": lambda: asyncio.to_thread(processor.check_api_key, client),
+            "voices": lambda: asyncio.to_thread(processor.list_voices, client),
+            "heygen_warm": lambda: asyncio.to_thread(processor.warm_up, client),
+            "telegram": bot.get_me,
+            "workspace_sweep": lambda: asyncio.to_thread(workspace.MANAGER.sweep),
+        },
+        fatal=("ffmpeg", "heygen_key", "telegram"),
+    )
+    voices = STARTUP.result("voices")
+    if voices is not None and DEFAULT_VOICE_ID not in {v.get("voice_id") for v in voices}:
+        logger.warning("HEYGEN_VOICE_ID %s not found in voice catalog", DEFAULT_VOICE_ID)
+    STARTUP.report()
+    # следим за блокировками цикла событий с первой секунды
+    loopmon.MONITOR.start()
+
+
 # Command handler
 @dp.message(Command("start"))
 async def start(message: Message, state: FSMContext) -> None:
@@ -44,6 +82,42 @@ async def start(message: Message, state: FSMContext) -> None:
     await state.set_state(Form.waiting_for_photo)
 
 
+@dp.message(Command("health"))
+async def health(message: Message) -> None:
+    """Состояние circuit breaker'ов, хеджей по эндпоинтам HeyGen, нагрузки и цикла событий.
+    Только для ADMIN_IDS."""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    await message.answer(json.dumps(
+        {
+            "endpoints": resilience.snapshot(),
+            "load": load_policy.POLICY.snapshot(),
+            "workspace": workspace.MANAGER.snapshot(),
+            "loop": loopmon.MONITOR.snapshot(),
+        },
+        indent=2,
+    ))
+
+
+@dp.message(Command("profile"))
+async def profile(message: Message, command: CommandObject) -> None:
+    """``/profile start|stop`` — сэмплирующий профайлер без рестарта, только для ADMIN_IDS."""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    if command.args == "start":
+        loopmon.PROFILER.start()
+        await message.answer("Профайлер запущен. /profile stop — остановить и получить стеки.")
+    elif command.args == "stop" and loopmon.PROFILER.running:
+        async with workspace.MANAGER.job() as ws:
+            path = ws.file("profile.folded")
+            samples = await asyncio.to_thread(loopmon.PROFILER.stop, path)
+            await message.answer_document(
+                FSInputFile(path), caption=f"{samples} сэмплов, folded-стеки для flamegraph"
+            )
+    else:
+        await message.answer("Использование: /profile start | /profile stop")
+
+
 # Video handler
 @dp.message(Command("video"))
 async def video(message: Message, state: FSMContext) -> None:
@@ -60,14 +134,16 @@ async def video(message: Message, state: FSMContext) -> None:
 @dp.message(Command("circle_video"))
 async def video_circle(message: Message, state: FSMContext) -> None:
     await message.answer("Пытаюсь отправить круглое видео")
-    new_video_path = await VideoProcessor.VideoProcessor.process_video_to_circle(
-        file_path=TEMP_VIDEO_PATH, output_path="circle_" + TEMP_VIDEO_PATH
-    )
-    with open(new_video_path, "rb") as video_file:
-        input_file = BufferedInputFile(
-            file=video_file.read(), filename="circular_video.mp4"
+    # результат — в каталоге задачи, параллельные /circle_video не пересекаются
+    async with workspace.MANAGER.job() as ws:
+        new_video_path = await VideoProcessor.VideoProcessor.process_video_to_circle(
+            file_path=TEMP_VIDEO_PATH, output_path=str(ws.file("circle_" + TEMP_VIDEO_PATH))
         )
-        await bot.send_video_note(chat_id=message.chat.id, video_note=input_file)
+        with open(new_video_path, "rb") as video_file:
+            input_file = BufferedInputFile(
+                file=video_file.read(), filename="circular_video.mp4"
+            )
+            await bot.send_video_note(chat_id=message.chat.id, video_note=input_file)
 
 
 # Обработка фото
@@ -88,7 +164,20 @@ async def not_photo(message: Message):
 # Обработка текста (подписи)
 @dp.message(Form.waiting_for_caption)
 async def process_caption(message: Message, state: FSMContext):
-    await message.answer("---берем загруженное фото---")
+    # при перегрузке задачу не берем, состояние (фото) остается для повтора
+    with jobtrace.RECORDER.job(0, len(message.text or "")) as trace:
+        try:
+            with load_policy.POLICY.job():
+                await render_caption(message, state, trace)
+        except load_policy.Overloaded as e:
+            trace.outcome = "shed"
+            await message.answer(str(e))
+
+
+async def render_caption(message: Message, state: FSMContext, trace: jobtrace.JobTrace):
+    # весь прогресс задачи — одно сообщение, которое правится по ходу
+    status = progress.ProgressReporter(bot, message.chat.id)
+    await status.update("---берем загруженное фото---")
     # Достаем сохраненное фото
     data = await state.get_data()
     photo_id = data["photo"]
@@ -96,98 +185,104 @@ async def process_caption(message: Message, state: FSMContext):
 
     photo_file = await bot.get_file(photo_id)
     if photo_file.file_path is None:
-        await message.answer("Ошибка: не удалось получить путь к файлу фото")
+        trace.outcome = "error"
+        await status.finish("Ошибка: не удалось получить путь к файлу фото")
         return
-    photo_path = f"temp_photo_{photo_id}.jpg"
+    trace.photo_size = photo_file.file_size or 0
 
-    await bot.download_file(photo_file.file_path, destination=photo_path)
-    await message.answer("---грузим его на сервис нейронок---")
-
-    # Создаем экземпляр процессора и HTTP-клиент
+    # Создаем экземпляр процессора, HTTP-клиент общий и уже прогрет на старте.
+    # Процессор синхронный (httpx.Client, time.sleep между опросами) — его вызовы
+    # уходят в поток, иначе цикл стоит и правки прогресса не доходят до чата
     processor = HeygenProcessor.HeygenProcessor()
-    client = httpx.Client()
+    client = HeygenProcessor.get_client()
 
-    video_path = None  # Инициализируем переменную для пути к видео
+    talking_photo_id = None
     try:
-        await message.answer("---пупупу....---")
-
-        # 1. Загружаем фото в Heygen
-        mime = processor.guess_mime(Path(photo_path))
-        talking_photo_id= None
-        talking_photo_id = processor.upload_talking_photo(
-            client, Path(photo_path), mime
-        )
-        await message.answer("---нейронка ПОШЛА---")
+        # 1. Загружаем фото в Heygen. Файлы задачи живут в своих каталогах и
+        # удаляются при любом исходе; на время рендера квоту не держим
+        async with workspace.MANAGER.job(reserve=max(trace.photo_size, workspace.MB)) as ws:
+            photo_path = ws.file("photo.jpg")
+            await bot.download_file(photo_file.file_path, destination=photo_path)
+            await status.update("---грузим его на сервис нейронок---")
+            mime = processor.guess_mime(photo_path)
+            with trace.phase("upload"):
+                talking_photo_id = await asyncio.to_thread(
+                    processor.upload_talking_photo, client, photo_path, mime
+                )
+        await status.update("---нейронка ПОШЛА---")
 
         # 2. Создаем видео (используем голос из .env)
         voice_id = os.environ.get("HEYGEN_VOICE_ID", "")
         if not voice_id:
-            await message.answer("Ошибка: не настроен голосовой ID")
+            trace.outcome = "error"
+            await status.finish("Ошибка: не настроен голосовой ID")
             return
 
-        video_id = processor.create_video(
-            client, talking_photo_id, caption, DEFAULT_VOICE_ID
-        )
-        await message.answer("---генерирует видиво---")
+        with trace.phase("render_wait"):
+            video_id = await asyncio.to_thread(
+                processor.create_video, client, talking_photo_id, caption, DEFAULT_VOICE_ID
+            )
+        await status.update("---генерирует видиво---")
         
 
         # 3. Ждем и скачиваем результат
-
-        video_path = f"result_{photo_id}.mp4"
-        print(video_path)
-        await message.answer("---ждем...=(---")
-        processor.wait_and_download(client, video_id, Path(video_path))
-        await message.answer("---жмем видосик в кругляху---")
-        print('loaded video')
-        # Отправляем видео пользователю
-        # with open(video_path, "rb") as video_file:
-        #     video_data = video_file.read()
-        # await message.answer_video(
-        #     video=BufferedInputFile(video_data, filename="result.mp4")
-        # )
-        new_video_path = None
-        new_video_path = await VideoProcessor.VideoProcessor.process_video_to_circle(
-            file_path=video_path, output_path="circle_" + video_path
-        )
-        with open(new_video_path, "rb") as video_file:
-            input_file = BufferedInputFile(
-                file=video_file.read(), filename="circular_video.mp4"
-            )
-            await bot.send_video_note(chat_id=message.chat.id, video_note=input_file)
+        await status.update("---ждем...=(---")
+        with trace.phase("render_wait"):
+            url = await asyncio.to_thread(processor.wait_video_url, client, video_id)
+
+        async with workspace.MANAGER.job() as ws:
+            video_path = ws.file("result.mp4")
+            with trace.phase("download"):
+                await asyncio.to_thread(processor.download, client, url, video_path)
+            await status.update("---жмем видосик в кругляху---")
+            print('loaded video')
+            # Отправляем видео пользователю
+            # with open(video_path, "rb") as video_file:
+            #     video_data = video_file.read()
+            # await message.answer_video(
+            #     video=BufferedInputFile(video_data, filename="result.mp4")
+            # )
+            with trace.phase("transcode"):
+                new_video_path = await VideoProcessor.VideoProcessor.process_video_to_circle(
+                    file_path=str(video_path), output_path=str(ws.file("circle_result.mp4"))
+                )
+            with trace.phase("send"), open(new_video_path, "rb") as video_file:
+                input_file = BufferedInputFile(
+                    file=video_file.read(), filename="circular_video.mp4"
+                )
+                await bot.send_video_note(chat_id=message.chat.id, video_note=input_file)
+        trace.outcome = "sent"
+        await status.finish("---готово---")
 
     except HeygenProcessor.HeygenError as e:
-        await message.answer(f"Ошибка Heygen: {str(e)}")
+        trace.outcome = "error"
+        await status.finish(f"Ошибка Heygen: {str(e)}")
     except Exception as e:
-        await message.answer(f"Неизвестная ошибка: {str(e)}")
+        trace.outcome = "error"
+        await status.finish(f"Неизвестная ошибка: {str(e)}")
     finally:
-        # Удаляем временные файлы
-        
-        if os.path.exists(photo_path):
-            os.remove(photo_path)
-        if video_path and os.path.exists(video_path):
-            os.remove(video_path)
-        if new_video_path and os.path.exists(new_video_path):
-            os.remove(new_video_path)
-        
-        r = client.delete(
-            f"{API_URL}/v2/photo_avatar/{talking_photo_id}",
-            headers=HEADERS,
-            timeout=TIMEOUT,
-        )
-        r.raise_for_status()
-        j = r.json() or {}
-        print(j)
-
-        r = client.delete(
-            f"{API_URL}/v2/photo_avatar_group/{talking_photo_id}",
-            headers=HEADERS,
-            timeout=TIMEOUT,
-        )
-        r.raise_for_status()
-        j = r.json() or {}
-        print(j)
-
-        client.close()
+        # временные файлы удалит workspace вместе с каталогом задачи
+        # фото могло не дойти до HeyGen — тогда и удалять нечего
+        if talking_photo_id is not None:
+            r = await asyncio.to_thread(
+                client.delete,
+                f"{API_URL}/v2/photo_avatar/{talking_photo_id}",
+                headers=HEADERS,
+                timeout=HeygenProcessor.TIMEOUT,
+            )
+            r.raise_for_status()
+            j = r.json() or {}
+            print(j)
+
+            r = await asyncio.to_thread(
+                client.delete,
+                f"{API_URL}/v2/photo_avatar_group/{talking_photo_id}",
+                headers=HEADERS,
+                timeout=HeygenProcessor.TIMEOUT,
+            )
+            r.raise_for_status()
+            j = r.json() or {}
+            print(j)
 
     await state.clear()
 
@@ -0,0 +1,133 @@
+"""Фаза запуска бота: ленивые импорты, префлайт-проверки и прогрев соединений.
+
+Модуль намеренно зависит только от stdlib, чтобы его можно было импортировать
+первым и засечь время, потраченное на остальные импорты.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib
+import logging
+import shutil
+import time
+import types
+from typing import Any, Awaitable, Callable, Optional
+
+PROCESS_START = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+
+class StartupError(RuntimeError):
+    pass
+
+
+class LazyModule(types.ModuleType):
+    """Прокси модуля: настоящий импорт происходит при первом обращении к атрибуту."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._load(), item)
+
+
+def lazy_module(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+async def check_binary(name: str) -> str:
+    """Проверяет, что бинарник есть в PATH, и возвращает первую строку `-version`."""
+    path = shutil.which(name)
+    if path is None:
+        raise StartupError(f"{name} не найден в PATH")
+    proc = await asyncio.create_subprocess_exec(
+        path, "-version",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise StartupError(f"{name} -version failed: {err.decode('utf-8', 'ignore')}")
+    return out.decode("utf-8", "ignore").splitlines()[0] if out else path
+
+
+def summarize(result: Any) -> str:
+    """Короткое описание результата проверки для лога (без дампа каталогов и квот)."""
+    if result is None:
+        return "-"
+    if isinstance(result, (list, tuple, set, dict)):
+        return f"{len(result)} items"
+    lines = str(result).splitlines()
+    return lines[0][:120] if lines else "-"
+
+
+class Startup:
+    """Собирает тайминги фаз запуска и прогоняет проверки конкурентно.
+
+    Проверки из ``fatal`` при ошибке останавливают запуск, остальные только
+    пишут предупреждение в лог.
+    """
+
+    def __init__(self) -> None:
+        self.timings: dict[str, float] = {}
+        self.results: dict[str, Any] = {}
+        self.errors: dict[str, BaseException] = {}
+        self._last_mark = PROCESS_START
+
+    def mark(self, phase: str) -> None:
+        """Записывает время, прошедшее с предыдущей отметки."""
+        now = time.perf_counter()
+        self.timings[phase] = now - self._last_mark
+        self._last_mark = now
+
+    async def _timed(self, name: str, check: Callable[[], Awaitable[Any]]) -> None:
+        started = time.perf_counter()
+        try:
+            self.results[name] = await check()
+        except Exception as e:
+            self.errors[name] = e
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    async def run(
+        self,
+        checks: dict[str, Callable[[], Awaitable[Any]]],
+        fatal: tuple[str, ...] = (),
+    ) -> dict[str, Any]:
+        self.mark("imports")
+        started = time.perf_counter()
+        await asyncio.gather(*(self._timed(n, c) for n, c in checks.items()))
+        self.timings["preflight"] = time.perf_counter() - started
+        self._last_mark = time.perf_counter()
+
+        for name, result in self.results.items():
+            logger.info("preflight %s: ok (%s)", name, summarize(result))
+        for name, e in self.errors.items():
+            logger.warning("preflight %s: %s", name, e)
+
+        failed = [name for name in fatal if name in self.errors]
+        if failed:
+            self.report()
+            raise StartupError(
+                "; ".join(f"{name}: {self.errors[name]}" for name in failed)
+            )
+        return self.results
+
+    def result(self, name: str) -> Optional[Any]:
+        return self.results.get(name)
+
+    def report(self) -> str:
+        total = time.perf_counter() - PROCESS_START
+        parts = [f"{name}={sec * 1000:.0f}ms" for name, sec in self.timings.items()]
+        line = f"startup total={total * 1000:.0f}ms " + " ".join(parts)
+        logger.info(line)
+        return line
@@ -0,0 +1,123 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("httpx")
+
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("API_HEYGEN", "test")
+
+import bot_0
+import workspace
+
+
+def test_parse_variants_product():
+    variants = bot_0.parse_variants("emotion=Excited,Serious talking_style=stable")
+    assert variants == [
+        {"emotion": "Excited", "talking_style": "stable"},
+        {"emotion": "Serious", "talking_style": "stable"},
+    ]
+
+
+@pytest.mark.parametrize("args", [
+    "",
+    "emotion=",
+    "emotion=,",
+    "emotion=Excited emotion=Serious",
+    "mood=happy",
+    "emotion",
+    "emotion=a,b,c,d talking_style=a,b,c",
+])
+def test_parse_variants_rejects(args):
+    with pytest.raises(ValueError):
+        bot_0.parse_variants(args)
+
+
+class FakeBot:
+    def __init__(self):
+        self.groups = []
+
+    async def send_media_group(self, chat_id, media):
+        self.groups.append([m.media.data for m in media])
+
+
+class FakeMessage:
+    def __init__(self):
+        self.chat = SimpleNamespace(id=1)
+        self.replies = []
+
+    async def reply(self, text, **_):
+        self.replies.append(text)
+
+
+def test_run_fanout_releases_workspaces_before_send(monkeypatch, tmp_path):
+    # квота на одну задачу: варианты не должны держать её до отправки группы
+    manager = workspace.WorkspaceManager(tmp_path, quota=workspace.MB, job_reserve=workspace.MB)
+    monkeypatch.setattr(workspace, "MANAGER", manager)
+    bot = FakeBot()
+    monkeypatch.setattr(bot_0, "bot", bot)
+
+    async def create_video(client, tp_id, text, voice_id, **opts):
+        return SimpleNamespace(video_id=opts["emotion"])
+
+    async def wait_video_url(client, video_id):
+        return video_id
+
+    async def download_video(client, url, path):
+        if url == "Broken":
+            raise RuntimeError("404")
+        path.write_bytes(url.encode())
+
+    async def transcode(src, dst):
+        dst.write_bytes(src.read_bytes())
+
+    monkeypatch.setattr(bot_0, "create_video", create_video)
+    monkeypatch.setattr(bot_0, "wait_video_url", wait_video_url)
+    monkeypatch.setattr(bot_0, "download_video", download_video)
+    monkeypatch.setattr(bot_0, "ffmpeg_square_640", transcode)
+
+    m = FakeMessage()
+    variants = bot_0.parse_variants("emotion=Excited,Broken,Serious")
+    sent = asyncio.run(asyncio.wait_for(bot_0.run_fanout(m, None, "tp", "hi", "v", variants), 5))
+    assert sent == 2
+    assert bot.groups == [[b"Excited", b"Serious"]]
+    assert len(m.replies) == 1 and "Broken" in m.replies[0]
+    assert manager.reserved == 0
+
+
+def test_render_job_reports_when_no_variant_delivered(monkeypatch):
+    async def pick_ru_voice(client):
+        return "v"
+
+    async def upload_talking_photo(client, data, mime):
+        return "tp"
+
+    async def run_fanout(*args):
+        return 0
+
+    monkeypatch.setattr(bot_0, "pick_ru_voice", pick_ru_voice)
+    monkeypatch.setattr(bot_0, "upload_talking_photo", upload_talking_photo)
+    monkeypatch.setattr(bot_0, "run_fanout", run_fanout)
+    monkeypatch.setattr(bot_0, "get_client", lambda: None)
+
+    m = FakeMessage()
+    ctx = {"photo_bytes": b"jpg", "photo_mime": "image/jpeg", "variants": [{"emotion": "Excited"}]}
+    trace = bot_0.jobtrace.JobTrace(arrival=0, photo_size=3, text_len=2)
+    asyncio.run(bot_0.render_job(m, ctx, "hi", trace))
+    assert trace.outcome == "error"
+    assert not any(r.startswith("Готово") for r in m.replies)
+    assert ctx == {}
+
+
+def test_health_only_for_admins(monkeypatch):
+    monkeypatch.setattr(bot_0, "ADMIN_IDS", {7})
+    stranger, admin = FakeMessage(), FakeMessage()
+    stranger.from_user = SimpleNamespace(id=8)
+    admin.from_user = SimpleNamespace(id=7)
+    asyncio.run(bot_0.on_health(stranger))
+    asyncio.run(bot_0.on_health(admin))
+    assert stranger.replies == []
+    assert '"endpoints"' in admin.replies[0]
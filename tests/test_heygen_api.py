@@ -0,0 +1,194 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from heygen_api import FakeHeyGen, HeyGenError, HeyGenHandler, ImageToVideoRequest, RetryPolicy, VideoResult
+
+NO_WAIT = RetryPolicy(attempts=3, backoff=0)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def handler_for(handle, retry=NO_WAIT):
+    return HeyGenHandler("key", transport=httpx.MockTransport(handle), retry=retry)
+
+
+def scripted(*responses):
+    """Transport that replays ``responses`` in order; exceptions are raised."""
+    calls = []
+
+    def handle(request):
+        calls.append(request.method)
+        item = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    return handle, calls
+
+
+GENERATED = httpx.Response(200, json={"status": "success", "data": {"video_id": "v1"}})
+STATUS_OK = httpx.Response(200, json={"data": {"video_id": "v1", "status": "completed",
+                                              "video_url": "https://x/v1.mp4"}})
+
+
+async def generate(handler):
+    async with handler:
+        return await handler.create_video_from_image_and_text("https://x/img.jpg", "hi")
+
+
+def test_get_retries_retryable_status():
+    handle, calls = scripted(httpx.Response(503, json={"message": "busy"}), STATUS_OK)
+    video = run(handler_for(handle).get_video_status("v1"))
+    assert video.video_url == "https://x/v1.mp4"
+    assert calls == ["GET", "GET"]
+
+
+def test_get_retries_read_timeout():
+    handle, calls = scripted(httpx.ReadTimeout("slow"), STATUS_OK)
+    assert run(handler_for(handle).get_video_status("v1")).status == "completed"
+    assert len(calls) == 2
+
+
+def test_post_retries_connect_error():
+    handle, calls = scripted(httpx.ConnectError("refused"), GENERATED)
+    assert run(generate(handler_for(handle))).video_id == "v1"
+    assert calls == ["POST", "POST"]
+
+
+@pytest.mark.parametrize("first", [
+    httpx.ReadTimeout("slow"),
+    httpx.RemoteProtocolError("reset"),
+])
+def test_post_not_retried_after_send(first):
+    handle, calls = scripted(first, GENERATED)
+    with pytest.raises(HeyGenError, match="Request failed"):
+        run(generate(handler_for(handle)))
+    assert calls == ["POST"]
+
+
+def test_post_not_retried_on_server_error():
+    handle, calls = scripted(httpx.Response(502, text="bad gateway"), GENERATED)
+    with pytest.raises(HeyGenError) as e:
+        run(generate(handler_for(handle)))
+    assert e.value.status_code == 502
+    assert calls == ["POST"]
+
+
+def test_post_retried_on_429():
+    handle, calls = scripted(httpx.Response(429, json={"message": "slow down"}), GENERATED)
+    assert run(generate(handler_for(handle))).video_id == "v1"
+    assert len(calls) == 2
+
+
+def test_gives_up_after_attempts():
+    fake = FakeHeyGen(fail_every=1)
+    handler = HeyGenHandler("key", transport=fake.transport, retry=NO_WAIT)
+    with pytest.raises(HeyGenError, match="fake outage") as e:
+        run(handler.get_video_status("v1"))
+    assert e.value.status_code == 503
+    assert fake.requests == NO_WAIT.attempts
+
+
+@pytest.mark.parametrize("response", [
+    httpx.Response(400, json=["bad", "request"]),
+    httpx.Response(400, json="bad request"),
+    httpx.Response(400, text="<html>bad request</html>"),
+])
+def test_error_body_not_a_dict(response):
+    handle, _ = scripted(response)
+    with pytest.raises(HeyGenError) as e:
+        run(handler_for(handle).get_video_status("v1"))
+    assert e.value.status_code == 400
+    assert "bad" in str(e.value)
+
+
+def test_unknown_video_maps_to_error():
+    handler = HeyGenHandler("key", transport=FakeHeyGen().transport, retry=NO_WAIT)
+    with pytest.raises(HeyGenError, match="unknown video") as e:
+        run(handler.get_video_status("nope"))
+    assert e.value.status_code == 404
+
+
+def test_failure_on_last_poll_is_reported():
+    failed = httpx.Response(200, json={"data": {"video_id": "v1", "status": "failed",
+                                                "error": "moderation"}})
+    handle, _ = scripted(failed)
+    handler = handler_for(handle)
+    with pytest.raises(HeyGenError, match="Render failed: moderation"):
+        run(handler.wait_for_video(VideoResult(video_id="v1"), delays=(0,)))
+
+
+def test_create_videos_keeps_input_order():
+    fake = FakeHeyGen(latency=0.01, render_time=0.02)
+    handler = HeyGenHandler("key", transport=fake.transport, retry=NO_WAIT)
+    requests = [ImageToVideoRequest(f"https://x/{i}.jpg", f"text {i}") for i in range(6)]
+
+    async def scenario():
+        async with handler:
+            return await handler.create_videos(requests, concurrency=3, delays=(0.01,) * 10)
+
+    results = run(scenario())
+    assert len(results) == 6
+    assert all(r.video_url == f"https://fake.heygen/{r.video_id}.mp4" for r in results)
+    # fake ids count requests as they arrive, so input order means increasing ids
+    submitted = [int(r.video_id.split("-")[1]) for r in results]
+    assert submitted == sorted(submitted)
+
+
+def test_create_videos_returns_errors_in_place():
+    calls = []
+
+    def handle(request):
+        calls.append(request)
+        text = request.read().decode()
+        if '"bad"' in text:
+            return httpx.Response(400, json={"message": "moderation"})
+        return httpx.Response(200, json={"status": "success",
+                                         "data": {"video_id": "v", "video_url": "https://x/v.mp4"}})
+
+    handler = handler_for(handle)
+    requests = [ImageToVideoRequest("https://x/a.jpg", t) for t in ("ok", "bad", "ok")]
+    results = run(handler.create_videos(requests, wait=False))
+    assert isinstance(results[0], VideoResult)
+    assert isinstance(results[1], HeyGenError) and results[1].status_code == 400
+    assert isinstance(results[2], VideoResult)
+
+
+def test_retry_policy_needs_an_attempt():
+    with pytest.raises(ValueError):
+        RetryPolicy(attempts=0)
+
+
+def test_shared_pool_survives_new_event_loop():
+    import http.server
+    import json
+    import threading
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = json.dumps({"data": {"video_id": "v1", "status": "completed"}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        handler = HeyGenHandler("key", f"http://127.0.0.1:{server.server_port}", retry=NO_WAIT)
+        # keep-alive connection from the first loop must not leak into the second
+        assert run(handler.get_video_status("v1")).status == "completed"
+        assert run(handler.get_video_status("v1")).status == "completed"
+    finally:
+        server.shutdown()
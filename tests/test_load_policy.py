@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from load_policy import LoadPolicy, Overloaded
+
+
+def test_waiting_jobs_are_not_shed():
+    policy = LoadPolicy(workers=2, shed_after=4, max_jobs=100)
+    with policy.job(), policy.job(), policy.job(), policy.job(), policy.job():
+        # пять задач ждут HeyGen, очередь транскодирования пуста
+        with policy.job():
+            assert policy.active_jobs == 6
+
+
+def test_sheds_on_transcode_queue():
+    policy = LoadPolicy(workers=1, shed_after=2, max_jobs=100)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def transcode():
+            async with policy.transcode_slot():
+                await release.wait()
+
+        tasks = [asyncio.create_task(transcode()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert policy.transcode_depth == 2
+        with pytest.raises(Overloaded, match=r"\(2\)"):
+            with policy.job():
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        with policy.job():
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_sheds_on_max_jobs():
+    policy = LoadPolicy(workers=1, shed_after=10, max_jobs=2)
+    with policy.job(), policy.job():
+        with pytest.raises(Overloaded):
+            with policy.job():
+                pass
+    assert policy.active_jobs == 0
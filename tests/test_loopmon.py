@@ -0,0 +1,39 @@
+import asyncio
+import threading
+import time
+
+from loopmon import LagMonitor
+
+
+def watchdogs() -> int:
+    return sum(t.name == "loop-watchdog" for t in threading.enumerate())
+
+
+def test_restart_leaves_single_watchdog():
+    monitor = LagMonitor(threshold=0.05, interval=0.01)
+
+    async def scenario():
+        for _ in range(5):
+            monitor.start()
+            monitor.stop()
+        monitor.start()
+        assert watchdogs() == 1
+        monitor.stop()
+
+    asyncio.run(scenario())
+    assert watchdogs() == 0
+
+
+def test_detects_blocked_loop():
+    monitor = LagMonitor(threshold=0.05, interval=0.01)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.2)
+        await asyncio.sleep(0.03)
+        monitor.stop()
+
+    asyncio.run(scenario())
+    assert monitor.stalls == 1
+    assert monitor.max_lag >= 0.15
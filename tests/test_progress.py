@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiogram.methods import EditMessageText, GetUpdates, SendMessage, SendVideoNote
+
+import progress
+
+
+def test_middleware_orders_by_method():
+    budget = progress.SendBudget(rate=1000, burst=5)
+    middleware = progress.BudgetMiddleware(budget)
+    order = []
+
+    async def make_request(bot, method):
+        order.append(method.__api_method__)
+
+    async def scenario():
+        # все три встают в очередь раньше, чем диспетчер успеет выдать токен
+        await asyncio.gather(
+            middleware(make_request, None, EditMessageText(text="1%", chat_id=1, message_id=1)),
+            middleware(make_request, None, SendMessage(chat_id=1, text="hi")),
+            middleware(make_request, None, SendVideoNote(chat_id=1, video_note="file-id")),
+        )
+
+    asyncio.run(scenario())
+    assert order == ["sendVideoNote", "sendMessage", "editMessageText"]
+
+
+def test_middleware_skips_get_methods():
+    budget = progress.SendBudget(rate=1000, burst=5)
+    middleware = progress.BudgetMiddleware(budget)
+
+    async def make_request(bot, method):
+        return method.__api_method__
+
+    assert asyncio.run(middleware(make_request, None, GetUpdates())) == "getUpdates"
+    # long polling не тратит токены и не запускает диспетчер
+    assert budget._tokens == budget.burst
+    assert budget._dispatcher is None
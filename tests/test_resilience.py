@@ -0,0 +1,177 @@
+import asyncio
+import time
+
+import pytest
+
+import resilience
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Endpoint, LatencyTracker
+
+
+def make_endpoint(threshold=1, reset_timeout=0.05, hedge_after=None):
+    ep = Endpoint("test")
+    ep.breaker = CircuitBreaker("test", failure_threshold=threshold, reset_timeout=reset_timeout)
+    if hedge_after is not None:
+        ep.latency = LatencyTracker(default=hedge_after)
+    return ep
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.allow()
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker("b", failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("b", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_single_probe():
+    breaker = CircuitBreaker("b", failure_threshold=1, reset_timeout=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    assert breaker.state == HALF_OPEN
+    breaker.allow()
+    with pytest.raises(CircuitOpenError, match="probe in flight"):
+        breaker.allow()
+
+
+def test_half_open_probe_success_closes():
+    breaker = CircuitBreaker("b", failure_threshold=1, reset_timeout=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.allow()
+
+
+def test_half_open_probe_failure_reopens():
+    breaker = CircuitBreaker("b", failure_threshold=3, reset_timeout=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_cancelled_guarded_probe_is_released():
+    ep = make_endpoint()
+    open_breaker(ep.breaker)
+    time.sleep(0.06)
+
+    async def scenario():
+        task = asyncio.ensure_future(resilience.guarded(ep, lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await resilience.guarded(ep, lambda: asyncio.sleep(0, "ok"))
+
+    assert asyncio.run(scenario()) == "ok"
+    assert ep.breaker.state == CLOSED
+
+
+def test_cancelled_hedged_caller_releases_probe():
+    ep = make_endpoint(hedge_after=0.01)
+    open_breaker(ep.breaker)
+    time.sleep(0.06)
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(10)
+
+    async def scenario():
+        task = asyncio.ensure_future(resilience.hedged(ep, slow))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert ep.breaker.state == HALF_OPEN
+        return await resilience.hedged(ep, lambda: asyncio.sleep(0, "ok"))
+
+    assert asyncio.run(scenario()) == "ok"
+    # в half-open хедж не отправляется
+    assert calls == [1]
+    assert ep.breaker.state == CLOSED
+
+
+def test_guarded_counts_is_failure():
+    ep = make_endpoint(threshold=2)
+
+    async def scenario():
+        for _ in range(2):
+            await resilience.guarded(ep, lambda: asyncio.sleep(0, 503), is_failure=lambda r: r >= 500)
+
+    asyncio.run(scenario())
+    assert ep.breaker.state == OPEN
+
+
+def test_latency_threshold_default_then_percentile():
+    tracker = LatencyTracker(default=2.0, min_samples=10, percentile=0.95)
+    for i in range(9):
+        tracker.observe(i / 100)
+    assert tracker.threshold() == 2.0
+    for i in range(9, 100):
+        tracker.observe(i / 100)
+    assert tracker.threshold() == pytest.approx(0.95)
+
+
+def test_hedge_fires_after_threshold_and_wins():
+    ep = make_endpoint(hedge_after=0.02)
+    delays = iter([1.0, 0.0])
+
+    async def call():
+        await asyncio.sleep(next(delays))
+        return "ok"
+
+    started = time.monotonic()
+    assert asyncio.run(resilience.hedged(ep, call)) == "ok"
+    assert time.monotonic() - started < 0.5
+    assert (ep.hedges, ep.hedge_wins) == (1, 1)
+
+
+def test_no_hedge_when_fast():
+    ep = make_endpoint(hedge_after=0.5)
+    assert asyncio.run(resilience.hedged(ep, lambda: asyncio.sleep(0, "ok"))) == "ok"
+    assert ep.hedges == 0
+
+
+def test_hedged_sync_hedge_wins():
+    ep = make_endpoint(hedge_after=0.02)
+    delays = iter([0.5, 0.0])
+
+    def call():
+        time.sleep(next(delays))
+        return "ok"
+
+    assert resilience.hedged_sync(ep, call) == "ok"
+    assert (ep.hedges, ep.hedge_wins) == (1, 1)
+
+
+def test_hedged_sync_all_fail_records_failure():
+    ep = make_endpoint(threshold=1, hedge_after=0.5)
+
+    def call():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        resilience.hedged_sync(ep, call)
+    assert ep.breaker.state == OPEN
@@ -0,0 +1,105 @@
+import asyncio
+import functools
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("httpx")
+
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("API_HEYGEN", "test")
+os.environ.setdefault("HEYGEN_VOICE_ID", "test-voice")
+
+import progress
+import simple_bot
+import workspace
+
+
+class FakeBot:
+    def __init__(self):
+        self.shown: list[str] = []
+        self.video_notes = 0
+
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path="photos/1.jpg", file_size=3)
+
+    async def download_file(self, path, destination):
+        destination.write_bytes(b"jpg")
+
+    async def send_message(self, chat_id, text, **_):
+        self.shown.append(text)
+        return SimpleNamespace(message_id=1)
+
+    async def edit_message_text(self, text, **_):
+        self.shown.append(text)
+
+    async def send_video_note(self, chat_id, video_note, **_):
+        self.video_notes += 1
+
+
+class BlockingProcessor:
+    """Синхронный процессор, как настоящий: блокирует поток на время запроса."""
+
+    def guess_mime(self, path):
+        return "image/jpeg"
+
+    def upload_talking_photo(self, client, path, mime):
+        time.sleep(0.2)
+        return "tp"
+
+    def create_video(self, client, tp_id, text, voice_id):
+        time.sleep(0.2)
+        return "video"
+
+    def wait_video_url(self, client, video_id):
+        time.sleep(0.3)
+        return "https://x/video.mp4"
+
+    def download(self, client, url, path):
+        path.write_bytes(b"mp4")
+
+
+class FakeState:
+    async def get_data(self):
+        return {"photo": "file-id"}
+
+    async def clear(self):
+        pass
+
+
+async def circle(file_path, output_path, **_):
+    with open(output_path, "wb") as f:
+        f.write(b"circle")
+    return output_path
+
+
+def test_progress_reaches_chat_while_heygen_blocks(monkeypatch, tmp_path):
+    bot = FakeBot()
+    client = SimpleNamespace(delete=lambda *a, **kw: SimpleNamespace(
+        raise_for_status=lambda: None, json=lambda: {}))
+    monkeypatch.setattr(simple_bot, "bot", bot)
+    monkeypatch.setattr(simple_bot, "HeygenProcessor", SimpleNamespace(
+        HeygenProcessor=BlockingProcessor, get_client=lambda: client,
+        HeygenError=RuntimeError, TIMEOUT=1,
+    ))
+    monkeypatch.setattr(simple_bot, "VideoProcessor", SimpleNamespace(
+        VideoProcessor=SimpleNamespace(process_video_to_circle=circle)))
+    monkeypatch.setattr(progress, "ProgressReporter",
+                        functools.partial(progress.ProgressReporter, min_interval=0.05))
+    monkeypatch.setattr(workspace, "MANAGER",
+                        workspace.WorkspaceManager(tmp_path, quota=10 * workspace.MB,
+                                                   job_reserve=workspace.MB))
+    message = SimpleNamespace(chat=SimpleNamespace(id=1), text="hello",
+                              answer=lambda *a, **kw: asyncio.sleep(0))
+
+    asyncio.run(simple_bot.process_caption(message, FakeState()))
+
+    assert bot.video_notes == 1
+    # статусы, за которыми идёт долгий вызов HeyGen, успевают дойти до чата;
+    # «генерирует видиво» сразу перекрывается «ждем» и склеивается с ним
+    for text in ("---нейронка ПОШЛА---", "---ждем...=(---"):
+        assert text in bot.shown
+    assert bot.shown[-1] == "---готово---"
@@ -0,0 +1,72 @@
+import asyncio
+from fractions import Fraction
+
+import pytest
+
+av = pytest.importorskip("av")
+
+import transcode
+
+
+def make_clip(path, size=720, seconds=1, fps=30):
+    """Клип с цветными кадрами и тоном, как у HeyGen: квадратное видео + AAC."""
+    with av.open(str(path), "w") as out:
+        video = out.add_stream("libx264", rate=fps)
+        video.width = video.height = size
+        video.pix_fmt = "yuv420p"
+        audio = out.add_stream("aac", rate=44100)
+        for i in range(seconds * fps):
+            frame = av.VideoFrame(size, size, "yuv420p")
+            for plane in frame.planes:
+                plane.update(bytes([i * 8 % 256]) * plane.buffer_size)
+            frame.pts = i
+            frame.time_base = Fraction(1, fps)
+            out.mux(video.encode(frame))
+        out.mux(video.encode(None))
+        samples = 1024
+        for i in range(seconds * 44100 // samples):
+            frame = av.AudioFrame(format="fltp", layout="mono", samples=samples)
+            frame.planes[0].update(bytes(samples * 4))
+            frame.sample_rate = 44100
+            frame.pts = i * samples
+            out.mux(audio.encode(frame))
+        out.mux(audio.encode(None))
+
+
+def probe(path):
+    with av.open(str(path)) as f:
+        v = f.streams.video[0]
+        a = f.streams.audio[0]
+        return {
+            "size": (v.codec_context.width, v.codec_context.height),
+            "fps": v.average_rate,
+            "profile": v.codec_context.profile,
+            "pix_fmt": v.codec_context.pix_fmt,
+            "audio": a.codec_context.name,
+        }
+
+
+@pytest.mark.parametrize("spec, size, fps, profile", [
+    (transcode.SQUARE_640, 640, 25, "Constrained Baseline"),
+    (transcode.circle_spec(), 512, 30, "High"),
+])
+def test_pyav_round_trip(tmp_path, spec, size, fps, profile):
+    src, dst = tmp_path / "in.mp4", tmp_path / "out.mp4"
+    make_clip(src)
+    backend = transcode.PyAVBackend(workers=1)
+    asyncio.run(backend.transcode(src, dst, spec))
+    got = probe(dst)
+    assert got["size"] == (size, size)
+    assert got["fps"] == fps
+    assert got["profile"] == profile
+    assert got["pix_fmt"] == "yuv420p"
+    assert got["audio"] == "aac"
+
+
+def test_pyav_in_memory(tmp_path):
+    src = tmp_path / "in.mp4"
+    make_clip(src)
+    data = transcode.transcode_bytes(src.read_bytes(), transcode.SQUARE_640)
+    out = tmp_path / "out.mp4"
+    out.write_bytes(data)
+    assert probe(out)["size"] == (640, 640)
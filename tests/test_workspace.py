@@ -0,0 +1,116 @@
+import asyncio
+import os
+import shutil
+
+import workspace
+from workspace import MB, WorkspaceManager
+
+
+def test_sweep_removes_previous_run_with_same_pid(tmp_path):
+    manager = WorkspaceManager(tmp_path, quota=10 * MB, job_reserve=MB)
+    pid = os.getpid()
+    (tmp_path / f"job-{pid}-0ldrun00-abc").mkdir()
+    (tmp_path / f"job-{pid}-{manager.instance}-abc").mkdir()
+    (tmp_path / "unrelated").mkdir()
+    assert manager.sweep() == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        f"job-{pid}-{manager.instance}-abc", "unrelated",
+    ]
+
+
+def test_sweep_respects_live_processes(tmp_path, monkeypatch):
+    manager = WorkspaceManager(tmp_path, quota=10 * MB, job_reserve=MB)
+    monkeypatch.setattr(workspace, "_pid_alive", lambda pid: pid == 4242)
+    (tmp_path / "job-4242-other000-abc").mkdir()
+    (tmp_path / "job-4343-other000-abc").mkdir()
+    assert manager.sweep() == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["job-4242-other000-abc"]
+
+
+def test_quota_capped_by_free_space(tmp_path):
+    free = shutil.disk_usage(tmp_path).free
+    manager = WorkspaceManager(tmp_path / "missing" / "root", quota=free * 2, job_reserve=MB)
+    assert manager.quota <= free
+
+
+def test_job_cleans_up_and_releases_quota(tmp_path):
+    manager = WorkspaceManager(tmp_path, quota=10 * MB, job_reserve=MB)
+
+    async def scenario():
+        async with manager.job() as ws:
+            ws.file("x").write_bytes(b"x")
+            assert manager.reserved == MB
+        return ws.path
+
+    path = asyncio.run(scenario())
+    assert not path.exists()
+    assert manager.reserved == 0
+
+
+def test_job_reserve_fits_several_jobs(tmp_path):
+    manager = WorkspaceManager(tmp_path, quota=64 * MB, job_reserve=200 * MB)
+    assert manager.job_reserve == 16 * MB
+
+
+def test_default_root_skips_small_tmpfs(monkeypatch):
+    monkeypatch.setattr(workspace, "_disk_free", lambda path: 64 * MB)
+    assert workspace.default_root(2048 * MB).parent != workspace.Path("/dev/shm")
+    if os.access("/dev/shm", os.W_OK):
+        assert workspace.default_root(32 * MB).parent == workspace.Path("/dev/shm")
+
+
+def test_waiters_served_in_order(tmp_path):
+    manager = WorkspaceManager(tmp_path, quota=4 * MB, job_reserve=MB)
+    order = []
+
+    async def job(name, reserve, hold):
+        async with manager.job(reserve=reserve):
+            order.append(name)
+            await hold.wait()
+
+    async def scenario():
+        first, rest = asyncio.Event(), asyncio.Event()
+        running = asyncio.create_task(job("first", 3 * MB, first))
+        await asyncio.sleep(0)
+        big = asyncio.create_task(job("big", 4 * MB, rest))
+        await asyncio.sleep(0)
+        # место под маленькую есть, но она встала в очередь за большой
+        small = asyncio.create_task(job("small", MB, rest))
+        await asyncio.sleep(0.01)
+        assert order == ["first"]
+        first.set()
+        await asyncio.sleep(0.01)
+        assert order == ["first", "big"]
+        rest.set()
+        await asyncio.gather(running, big, small)
+
+    asyncio.run(scenario())
+    assert order == ["first", "big", "small"]
+    assert manager.reserved == 0
+
+
+def test_cancelled_waiter_unblocks_queue(tmp_path):
+    manager = WorkspaceManager(tmp_path, quota=4 * MB, job_reserve=MB)
+
+    async def scenario():
+        hold = asyncio.Event()
+
+        async def job(reserve):
+            async with manager.job(reserve=reserve):
+                await hold.wait()
+
+        running = asyncio.create_task(job(3 * MB))
+        await asyncio.sleep(0)
+        big = asyncio.create_task(job(4 * MB))
+        small = asyncio.create_task(job(MB))
+        await asyncio.sleep(0.01)
+        assert manager.reserved == 3 * MB
+        big.cancel()
+        await asyncio.sleep(0.01)
+        assert manager.reserved == 4 * MB  # маленькая прошла
+        hold.set()
+        await asyncio.gather(running, small)
+        assert big.cancelled()
+
+    asyncio.run(scenario())
+    assert manager.reserved == 0
@@ -0,0 +1,271 @@
+"""Подключаемые бэкенды транскодирования.
+
+``subprocess`` — прежнее поведение: отдельный процесс ffmpeg на каждую задачу.
+``pyav`` — декодирование, scale/pad и кодирование внутри процесса через
+PyAV (libav) из файла в файл (или из буфера в буфер, ``transcode_bytes``), на
+пуле потоков или процессов. Оба бэкенда
+используют одну и ту же цепочку фильтров из ``TranscodeSpec``.
+
+Выбор бэкенда: ``TRANSCODE_BACKEND=subprocess|pyav`` (по умолчанию subprocess),
+пул для pyav: ``TRANSCODE_POOL=thread|process``, ``TRANSCODE_WORKERS``.
+
+PyAV — необязательная зависимость (``pip install av``, закомментирована в
+requirements.txt); без неё ``pyav`` откатывается на subprocess. Совпадение
+параметров выхода обоих бэкендов проверяет ``bench_transcode.py``.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import io
+import logging
+import os
+from dataclasses import dataclass
+from fractions import Fraction
+from pathlib import Path
+from typing import Optional
+
+import load_policy
+
+logger = logging.getLogger(__name__)
+
+
+class TranscodeError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class TranscodeSpec:
+    vf: str
+    size: int  # сторона квадратного кадра на выходе цепочки
+    crf: int
+    preset: str
+    fps: Optional[int] = None
+    profile: Optional[str] = None
+    level: Optional[str] = None
+    pix_fmt: Optional[str] = None
+    audio_codec: Optional[str] = None
+    audio_bitrate: Optional[str] = None
+    threads: Optional[int] = None  # None — решает кодек
+
+    def filters(self) -> list[tuple[str, str]]:
+        """Цепочка ``-vf`` в виде (имя, аргументы) для libavfilter."""
+        chain = []
+        for part in self.vf.split(","):
+            name, _, args = part.partition("=")
+            chain.append((name, args))
+        return chain
+
+
+def circle_spec(bg_color: str = "white") -> TranscodeSpec:
+    """Кружок 512×512 (VideoProcessor.process_video_to_circle)."""
+    return TranscodeSpec(
+        vf=f"scale=w=512:h=512:force_original_aspect_ratio=decrease,"
+           f"pad=w=512:h=512:x=(ow-iw)/2:y=(oh-ih)/2:color={bg_color}",
+        size=512,
+        crf=23,
+        preset="fast",
+    )
+
+
+# 720→640, 25 fps, H.264 Baseline + AAC (bot_0.ffmpeg_square_640)
+SQUARE_640 = TranscodeSpec(
+    vf="scale=640:640",
+    size=640,
+    crf=20,
+    preset="veryfast",
+    fps=25,
+    profile="baseline",
+    level="3.0",
+    pix_fmt="yuv420p",
+    audio_codec="aac",
+    audio_bitrate="128k",
+)
+
+
+def ffmpeg_command(src: Path, dst: Path, spec: TranscodeSpec) -> list[str]:
+    cmd = ["ffmpeg", "-y", "-i", str(src), "-vf", spec.vf]
+    if spec.fps:
+        cmd += ["-r", str(spec.fps)]
+    cmd += ["-c:v", "libx264"]
+    if spec.profile:
+        cmd += ["-profile:v", spec.profile]
+    if spec.level:
+        cmd += ["-level", spec.level]
+    if spec.pix_fmt:
+        cmd += ["-pix_fmt", spec.pix_fmt]
+    cmd += ["-crf", str(spec.crf), "-preset", spec.preset]
+    if spec.threads:
+        cmd += ["-threads", str(spec.threads)]
+    if spec.audio_codec:
+        cmd += ["-c:a", spec.audio_codec]
+    if spec.audio_bitrate:
+        cmd += ["-b:a", spec.audio_bitrate]
+    cmd += ["-movflags", "+faststart", str(dst)]
+    return cmd
+
+
+class SubprocessBackend:
+    name = "subprocess"
+
+    async def transcode(self, src: Path, dst: Path, spec: TranscodeSpec) -> None:
+        proc = await asyncio.create_subprocess_exec(
+            *ffmpeg_command(src, dst, spec),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, err = await proc.communicate()
+        if proc.returncode != 0:
+            raise TranscodeError(f"ffmpeg failed: {err.decode('utf-8', 'ignore')}")
+
+
+def _bitrate(value: str) -> int:
+    value = value.lower()
+    if value.endswith("k"):
+        return int(float(value[:-1]) * 1000)
+    if value.endswith("m"):
+        return int(float(value[:-1]) * 1_000_000)
+    return int(value)
+
+
+def transcode_bytes(data: bytes, spec: TranscodeSpec) -> bytes:
+    """Транскодирует mp4 из памяти в память. Выполняется в воркере пула.
+
+    Без faststart: второй проход muxer'а переоткрывает выход по имени файла,
+    а у буфера его нет.
+    """
+    out_buf = io.BytesIO()
+    _transcode(io.BytesIO(data), out_buf, spec, {})
+    return out_buf.getvalue()
+
+
+def transcode_file(src: str, dst: str, spec: TranscodeSpec) -> None:
+    """Транскодирует файл в файл с ``+faststart``, как subprocess-бэкенд."""
+    _transcode(src, dst, spec, {"movflags": "+faststart"})
+
+
+def _transcode(src, dst, spec: TranscodeSpec, mux_options: dict[str, str]) -> None:
+    import av
+
+    with av.open(src, "r") as inp, av.open(dst, "w", format="mp4", options=mux_options) as out:
+        vin = inp.streams.video[0]
+        ain = inp.streams.audio[0] if inp.streams.audio else None
+
+        graph = av.filter.Graph()
+        last = graph.add_buffer(template=vin)
+        chain = spec.filters()
+        if spec.fps:
+            chain.append(("fps", str(spec.fps)))
+        chain.append(("format", spec.pix_fmt or "yuv420p"))
+        for name, args in chain:
+            node = graph.add(name, args)
+            last.link_to(node)
+            last = node
+        sink = graph.add("buffersink")
+        last.link_to(sink)
+        graph.configure()
+
+        time_base = Fraction(1, spec.fps) if spec.fps else vin.time_base
+        vout = out.add_stream("libx264", rate=spec.fps or vin.average_rate)
+        vout.width = vout.height = spec.size
+        vout.pix_fmt = spec.pix_fmt or "yuv420p"
+        vout.codec_context.time_base = time_base
+        if spec.threads:
+            vout.codec_context.thread_count = spec.threads
+        options = {"crf": str(spec.crf), "preset": spec.preset}
+        if spec.profile:
+            options["profile"] = spec.profile
+        if spec.level:
+            options["level"] = spec.level
+        vout.options = options
+
+        aout = None
+        if ain is not None:
+            aout = out.add_stream(spec.audio_codec or "aac", rate=ain.rate)
+            if spec.audio_bitrate:
+                aout.bit_rate = _bitrate(spec.audio_bitrate)
+
+        def drain_graph() -> None:
+            while True:
+                try:
+                    frame = graph.pull()
+                except (BlockingIOError, av.error.EOFError):
+                    return
+                frame.time_base = time_base
+                out.mux(vout.encode(frame))
+
+        streams = [vin] + ([ain] if ain is not None else [])
+        for packet in inp.demux(*streams):
+            for frame in packet.decode():
+                if packet.stream.type == "video":
+                    graph.push(frame)
+                    drain_graph()
+                else:
+                    out.mux(aout.encode(frame))
+        graph.push(None)
+        drain_graph()
+        out.mux(vout.encode(None))
+        if aout is not None:
+            out.mux(aout.encode(None))
+
+
+class PyAVBackend:
+    """In-process транскодер; тяжёлая работа уходит в пул, цикл событий не блокируется."""
+
+    name = "pyav"
+
+    def __init__(self, pool: str = "thread", workers: Optional[int] = None):
+        import av  # noqa: F401  — проверяем наличие заранее
+
+        workers = workers or os.cpu_count() or 2
+        if pool == "process":
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="pyav"
+            )
+
+    async def transcode_bytes(self, data: bytes, spec: TranscodeSpec) -> bytes:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, transcode_bytes, data, spec)
+        except Exception as e:
+            raise TranscodeError(f"pyav failed: {e}") from e
+
+    async def transcode(self, src: Path, dst: Path, spec: TranscodeSpec) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, transcode_file, str(src), str(dst), spec)
+        except Exception as e:
+            raise TranscodeError(f"pyav failed: {e}") from e
+
+
+_backend = None
+
+
+def get_backend():
+    """Бэкенд из ``TRANSCODE_BACKEND``; без PyAV откатывается на subprocess."""
+    global _backend
+    if _backend is None:
+        name = os.environ.get("TRANSCODE_BACKEND", "subprocess")
+        if name == "pyav":
+            try:
+                _backend = PyAVBackend(
+                    pool=os.environ.get("TRANSCODE_POOL", "thread"),
+                    workers=int(os.environ.get("TRANSCODE_WORKERS", "0")) or None,
+                )
+            except ImportError:
+                logger.warning("PyAV is not installed, falling back to subprocess ffmpeg")
+        if _backend is None:
+            _backend = SubprocessBackend()
+    return _backend
+
+
+async def run(src: Path, dst: Path, spec: TranscodeSpec) -> None:
+    """Транскодирует через текущий бэкенд с пресетом под нагрузку (load_policy)."""
+    async with load_policy.POLICY.transcode_slot():
+        adapted = load_policy.POLICY.adapt(spec)
+        if adapted != spec:
+            logger.info("transcode %s: preset=%s crf=%s threads=%s",
+                        load_policy.POLICY.level(), adapted.preset, adapted.crf, adapted.threads)
+        await get_backend().transcode(src, dst, adapted)
@@ -0,0 +1,198 @@
+"""Изолированные рабочие каталоги для задач с общей квотой на диск.
+
+Каждая задача получает свой каталог ``<root>/job-<pid>-<instance>-<id>`` и
+резервирует под него байты из общей квоты; если квоты не хватает, задача ждёт
+(backpressure), а не забивает диск. Каталог удаляется при завершении, отмене
+или ошибке задачи; каталоги упавших процессов подчищает ``sweep()`` на старте.
+``instance`` нужен, потому что в контейнере бот после каждого рестарта снова
+PID 1, и по одному pid прошлый запуск от текущего не отличить.
+
+Квота не может быть больше места на разделе: ``/dev/shm`` под Docker по
+умолчанию всего 64 МБ, поэтому tmpfs берётся, только если квота в нём
+помещается. Резерв на задачу урезается так, чтобы в квоту влезало хотя бы
+``MIN_CONCURRENT_JOBS`` задач. Ожидающие получают место строго по очереди.
+
+Переменные окружения: ``WORKSPACE_ROOT`` (по умолчанию tmpfs ``/dev/shm``, если
+он есть и в нём хватает места), ``WORKSPACE_QUOTA_MB``, ``WORKSPACE_JOB_MB``
+(резерв на задачу).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def _disk_free(path: Path) -> Optional[int]:
+    """Свободное место на разделе ``path`` (или ближайшего существующего предка)."""
+    for candidate in (path, *path.parents):
+        if candidate.exists():
+            try:
+                return shutil.disk_usage(candidate).free
+            except OSError:
+                return None
+    return None
+
+
+def default_root(quota: int) -> Path:
+    """tmpfs ``/dev/shm``, если в нём помещается квота, иначе обычный временный каталог."""
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        free = _disk_free(shm)
+        if free is not None and free >= quota:
+            return shm / "round_head"
+        logger.info("/dev/shm has %d MB free, less than the %d MB quota; using disk",
+                    (free or 0) // MB, quota // MB)
+    return Path(tempfile.gettempdir()) / "round_head"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Workspace:
+    def __init__(self, path: Path, reserved: int):
+        self.path = path
+        self.reserved = reserved
+
+    def file(self, name: str) -> Path:
+        return self.path / name
+
+    def usage(self) -> int:
+        return sum(p.stat().st_size for p in self.path.rglob("*") if p.is_file())
+
+
+class WorkspaceManager:
+    # столько задач с резервом по умолчанию должно помещаться в квоту одновременно
+    MIN_CONCURRENT_JOBS = 4
+
+    def __init__(self, root: Path, quota: int, job_reserve: int):
+        self.root = root
+        self.instance = uuid.uuid4().hex[:8]
+        free = _disk_free(root)
+        if free is not None and free < quota:
+            logger.warning("workspace quota %d MB exceeds free space on %s, capping at %d MB",
+                           quota // MB, root, free // MB)
+            quota = free
+        if job_reserve * self.MIN_CONCURRENT_JOBS > quota:
+            job_reserve = max(quota // self.MIN_CONCURRENT_JOBS, 1)
+            logger.warning("workspace job reserve lowered to %d MB to fit %d jobs in the quota",
+                           job_reserve // MB, self.MIN_CONCURRENT_JOBS)
+        self.quota = quota
+        self.job_reserve = job_reserve
+        self.reserved = 0
+        # очередь ожидающих по порядку прихода: крупный резерв (fan-out) не
+        # обгоняют бесконечно мелкие задачи
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+
+    def _grant(self) -> None:
+        while self._waiters:
+            need, fut = self._waiters[0]
+            if fut.done():  # ожидающий отменён
+                self._waiters.popleft()
+                continue
+            if self.reserved + need > self.quota:
+                return
+            self._waiters.popleft()
+            self.reserved += need
+            fut.set_result(None)
+
+    def _release(self, need: int) -> None:
+        self.reserved -= need
+        self._grant()
+
+    async def _reserve(self, need: int) -> None:
+        if not self._waiters and self.reserved + need <= self.quota:
+            self.reserved += need
+            return
+        logger.info("workspace quota full (%d/%d MB), waiting",
+                    self.reserved // MB, self.quota // MB)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append((need, fut))
+        self._grant()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.cancelled():
+                # место ещё не выдали — могли задерживать очередь за собой
+                self._grant()
+            else:
+                # выдали, но задачу отменили раньше, чем она его забрала
+                self._release(need)
+            raise
+
+    @asynccontextmanager
+    async def job(self, reserve: Optional[int] = None) -> AsyncIterator[Workspace]:
+        """Каталог задачи; в порядке очереди ждёт, пока в квоте освободится ``reserve`` байт."""
+        need = min(reserve or self.job_reserve, self.quota)
+        await self._reserve(need)
+        path = self.root / f"job-{os.getpid()}-{self.instance}-{uuid.uuid4().hex[:12]}"
+        try:
+            path.mkdir(parents=True)
+            ws = Workspace(path, need)
+            yield ws
+            used = ws.usage()
+            if used > need:
+                logger.warning("workspace %s used %d MB over its %d MB reserve",
+                               path.name, used // MB, need // MB)
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            self._release(need)
+
+    def sweep(self) -> int:
+        """Удаляет каталоги задач прошлых запусков и мёртвых процессов. Возвращает их число."""
+        if not self.root.is_dir():
+            return 0
+        removed = 0
+        for entry in self.root.iterdir():
+            if not entry.is_dir() or not entry.name.startswith("job-"):
+                continue
+            parts = entry.name.split("-")
+            try:
+                pid = int(parts[1])
+            except (IndexError, ValueError):
+                continue
+            if pid == os.getpid():
+                # тот же pid, но другой instance — прошлый запуск контейнера
+                if len(parts) > 3 and parts[2] == self.instance:
+                    continue
+            elif _pid_alive(pid):
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            removed += 1
+        if removed:
+            logger.info("swept %d orphaned workspaces in %s", removed, self.root)
+        return removed
+
+    def snapshot(self) -> dict:
+        return {
+            "root": str(self.root),
+            "reserved_mb": self.reserved // MB,
+            "quota_mb": self.quota // MB,
+        }
+
+
+_QUOTA = int(os.environ.get("WORKSPACE_QUOTA_MB", "2048")) * MB
+
+MANAGER = WorkspaceManager(
+    root=Path(os.environ.get("WORKSPACE_ROOT") or default_root(_QUOTA)),
+    quota=_QUOTA,
+    job_reserve=int(os.environ.get("WORKSPACE_JOB_MB", "200")) * MB,
+)